@@ -2,22 +2,26 @@
 
 import sys
 import time
-import copy
 import datetime
 import argparse
 from functools import wraps
+from itertools import chain
 from operator import itemgetter
 
 from clint.textui import colored, columns, puts, indent
 
-from consfinder.profiles import BinaryProfile
+from consfinder.profiles import BinaryProfile, SlidingWindowMonitor, iter_binary_vectors
 from consfinder.experiments_manager import ExperimentsManager, EuclideanExperimetsManager
 from consfinder.experiments_manager import MANAGERS_MAP
-from consfinder.functions import ConsensusO1, ConsensusO2, OptimalAlgorithm, CONSENSUS_ALGORITHMS
+from consfinder.databases import RESULTS_PAGE_SIZE
+from consfinder.functions import (ConsensusO1, ConsensusO2, ConsensusO2BranchAndBound, OptimalAlgorithm,
+    CONSENSUS_ALGORITHMS, DEFAULT_ALGORITHMS, SearchControl, ProgressBar)
 
 
 COLUMN_WIDTH = 20
 CONSISTENCY_FUNCTIONS = ['c1', 'c2', 'c3', 'c4', 'c5']
+UNIVERSE_ALGORITHMS = [ConsensusO2.name]  # algorithms which scan the whole universe
+MAX_UNIVERSE_LENGTH = 25
 
 
 def _add_to_all(subparsers, *args, **kwargs):
@@ -55,8 +59,11 @@ def _confirm_action(text):
 
 def length_validator(args):
     length = getattr(args, 'length')
-    if length and length > 15:
-        return False, 'Profile length > 15 can eat your whole memory!'
+    algorithms = getattr(args, 'algorithms', UNIVERSE_ALGORITHMS)
+    if length and length > MAX_UNIVERSE_LENGTH and set(algorithms) & set(UNIVERSE_ALGORITHMS):
+        return False, ('Profile length > %s takes hours to process! (%s scan the whole universe, use %s '
+            'for the same consensus found by branch and bound)' % (MAX_UNIVERSE_LENGTH, UNIVERSE_ALGORITHMS,
+            ConsensusO2BranchAndBound.name))
     return True, ''
 
 
@@ -92,7 +99,7 @@ def validate(*validators):
     return __outer
 
 
-def process_onetest(profile):
+def process_onetest(profile, time_limit=None):
     puts(colored.green(
         '==Processing profile with %s elements' % len(profile.elements)))
     with indent(2, ''):
@@ -132,7 +139,10 @@ def process_onetest(profile):
             puts("%s (%s)" % (con, profile.quality(con)))
 
     puts(colored.green('\n==o2 consensus (quality): '))
-    consensus_o2 = ConsensusO2.run(profile)
+    control = SearchControl(time_limit=time_limit, callback=ProgressBar(), interruptible=True)
+    consensus_o2 = ConsensusO2.run(profile, control)
+    if not consensus_o2.exhaustive:
+        puts(colored.yellow('Search stopped before the whole universe was checked, best elements found so far:'))
     with indent(2, ''):
         for con in consensus_o2:
             puts("%s (%s)" % (con, profile.quality(con)))
@@ -152,10 +162,10 @@ def process_experiments_results(results):
 
 def process_results_from_db(results):
     for res in results:
-        t = res.pop('timestamp')
-        params = res.pop('params')
+        t = res['timestamp']
+        params = res['params']
         puts(colored.green('\n==%s (%s)' % (_str_dict(params), datetime.datetime.fromtimestamp(t))))
-        fields = sorted(res.keys())
+        fields = sorted(k for k in res.keys() if k not in ('timestamp', 'params'))
         header = [['No', COLUMN_WIDTH]]
         header.extend([[k, COLUMN_WIDTH] for k in fields])
         puts(columns(*header))
@@ -191,15 +201,42 @@ def handle_onetest(args):
         profile.load(args.load)
     else:
         profile.generate()
-    process_onetest(profile)
+    process_onetest(profile, args.time_limit)
+
+
+def _monitor_stream(f, window, every):
+    # readline instead of iterating the file, which reads ahead in blocks
+    vectors = iter_binary_vectors(iter(f.readline, ''))
+    try:
+        first = next(vectors)
+    except StopIteration:
+        return
+    monitor = SlidingWindowMonitor(window, len(first))
+    header = [[name, COLUMN_WIDTH] for name in ['Arrivals'] + CONSISTENCY_FUNCTIONS + ['o1 consensus']]
+    puts(columns(*header))
+    for arrivals, measures, consensus in monitor.run(chain([first], vectors), every):
+        row = [[str(arrivals), COLUMN_WIDTH]]
+        row.extend([[_format_value(v), COLUMN_WIDTH] for v in measures.values()])
+        ties = ' (%s ties)' % consensus.size if consensus.size > 1 else ''
+        row.append(['%s%s' % (''.join(map(str, consensus[0])), ties), COLUMN_WIDTH])
+        puts(columns(*row))
+        sys.stdout.flush()
+
+
+def handle_stream(args):
+    if args.input:
+        with open(args.input) as f:
+            _monitor_stream(f, args.window, args.every)
+    else:
+        _monitor_stream(sys.stdin, args.window, args.every)
 
 
 @validate(length_validator, functions_validator, algorithms_validator)
 def handle_binary_experiments(args):
-    manager = ExperimentsManager()
+    manager = ExperimentsManager(args.db)
     results = manager.get_results(args.length, args.number)
     if results and _confirm_action('Results for this test available. [y] to show results, [n] to run new experiments.'):
-        process_results_from_db(copy.deepcopy(results))
+        process_results_from_db(results)
         if args.csv:
             params = results[0]['params']
             filename = getattr(args, 'filename', '') or _get_csv_results_filename(n=params['n'], l=params['length'])
@@ -214,10 +251,10 @@ def handle_binary_experiments(args):
 
 
 def handle_euclidean_experiments(args):
-    manager = EuclideanExperimetsManager()
+    manager = EuclideanExperimetsManager(args.db)
     results = manager.get_results(args.number)
     if results and _confirm_action('Results for this test available. [y] to show results, [n] to run new experiments.'):
-        process_results_from_db(copy.deepcopy(results))
+        process_results_from_db(results)
         if args.csv:
             params = results[0]['params']
             filename = getattr(args, 'filename', '') or _get_csv_results_filename(n=params['n'])
@@ -231,6 +268,22 @@ def handle_euclidean_experiments(args):
             res = manager.write_to_csv(results, filename)
 
 
+def handle_export(args):
+    if args.kind == 'binary' and (args.length is None) != (args.number is None):
+        puts(colored.red('Give both length and size of collective (or none of them to export everything)'))
+        sys.exit(-1)
+    manager = MANAGERS_MAP[args.kind](args.db)
+    if args.number is None:
+        key = None
+    elif args.kind == 'binary':
+        key = [args.length, args.number]
+    else:
+        key = [args.number]
+    count = manager.export_results(args.filename, key, args.page_size)
+    if count is not None:
+        puts(colored.green('Exported %s results to %s' % (count, args.filename)))
+
+
 def _handle_correlations(manager, var_x, var_y, names):
     col_width = COLUMN_WIDTH + 2
     results = manager.get_correlations(var_x, var_y)
@@ -244,21 +297,56 @@ def _handle_correlations(manager, var_x, var_y, names):
 
 
 def handle_binary_correlations(args):
-    e = ExperimentsManager()
+    e = ExperimentsManager(args.db)
     names = ['length' ,'n' , 'spearman', 'p-value', 'pearson', 'p-value']
     _handle_correlations(e, args.var_x, args.var_y, names)
 
 
 def handle_euclidean_correlations(args):
-    e = EuclideanExperimetsManager()
+    e = EuclideanExperimetsManager(args.db)
     names = ['n' , 'spearman', 'p-value', 'pearson', 'p-value']
     _handle_correlations(e, args.var_x, args.var_y, names)
 
 
+def _format(value):
+    return '%.4f' % value if isinstance(value, float) else str(value)
+
+
+def handle_analysis(args):
+    manager = MANAGERS_MAP[args.kind](args.db)
+    results = manager.get_analysis(args.variables, args.bootstrap, args.confidence, args.seed, args.workers,
+        not args.no_cache)
+    if results is None:
+        return
+    col_width = COLUMN_WIDTH + 2
+    names = ['var_x', 'var_y', 'spearman', 'p-value', 'pearson', 'p-value']
+    if args.bootstrap:
+        names.extend(['spearman CI', 'pearson CI'])
+    for r in results:
+        puts(colored.green('\n==%s: %s (%s runs)' % (', '.join(manager.DB_KEY), ', '.join(map(str, r['key'])),
+            r['runs'])))
+        puts(columns(*[[col, col_width] for col in names]))
+        variables = r['names']
+        for i in xrange(len(variables)):
+            for j in xrange(i + 1, len(variables)):
+                values = [variables[i], variables[j]] + [r[k][i][j] for k in
+                    ['spearman', 'spearman_p', 'pearson', 'pearson_p']]
+                row = [_format(x) for x in values]
+                if args.bootstrap:
+                    row.extend('[%s, %s]' % tuple(_format(x) for x in r[k][i][j])
+                        for k in ['spearman_ci', 'pearson_ci'])
+                puts(columns(*[[x, col_width] for x in row]))
+        puts(colored.green('Shapiro-Wilk'))
+        for name, (w, p_value) in zip(variables, r['shapiro']):
+            puts(columns(*[[x, col_width] for x in [name, _format(w), _format(p_value)]]))
+
+
 def main():
     import config
 
     app = argparse.ArgumentParser()
+    app.add_argument('--db', choices=['couchdb', 'sqlite'],
+        help='where results are stored - CouchDB server or local SQLite file (default: %s)' % config.DB_BACKEND)
     subparsers = app.add_subparsers()
 
     onetest = subparsers.add_parser('onetest',
@@ -269,9 +357,22 @@ def main():
         help='length of single vector')
     onetest.add_argument('--load',
         help='process profile from given file')
+    onetest.add_argument('--time-limit', type=float,
+        help='stop the search for o2 consensus after given number of seconds and show the best '
+            'elements found so far (Ctrl-C does the same)')
     onetest.set_defaults(func=handle_onetest)
 
 
+    stream = subparsers.add_parser('stream',
+        help='Monitor consistency of a sliding window over binary vectors arriving one per line.')
+    stream.add_argument('input', nargs='?',
+        help='file with comma separated vectors (default: standard input)')
+    stream.add_argument('-w', '--window', type=int, default=100,
+        help='number of latest vectors forming the profile (default: 100)')
+    stream.add_argument('-k', '--every', type=int, default=1,
+        help='show results after every k arrivals (default: 1)')
+    stream.set_defaults(func=handle_stream)
+
     experiments = subparsers.add_parser('experiments', help='Run multiple experiments.')
     experiements_types = experiments.add_subparsers()
     binary = experiements_types.add_parser('binary', help='Experiments for binary structure')
@@ -283,8 +384,16 @@ def main():
     binary.add_argument('-l', '--length', type=int, help='length of single vector')
     binary.add_argument('-f', '--functions', nargs='*', default=CONSISTENCY_FUNCTIONS,
         help='specify which consistency functions to test (default: all, possible values: %s)' % CONSISTENCY_FUNCTIONS)
-    binary.add_argument('-a', '--algorithms', nargs='*', default=CONSENSUS_ALGORITHMS.keys(),
-        help='specify which consensus algorithms to use (default: all, possible values: %s)' % CONSENSUS_ALGORITHMS.keys())
+    binary.add_argument('-a', '--algorithms', nargs='*', default=DEFAULT_ALGORITHMS,
+        help='specify which consensus algorithms to use (default: %s, possible values: %s; %s finds the same '
+            'consensus as %s and works also for lengths > %s)' % (DEFAULT_ALGORITHMS, CONSENSUS_ALGORITHMS.keys(),
+            ConsensusO2BranchAndBound.name, ConsensusO2.name, MAX_UNIVERSE_LENGTH))
+    binary.add_argument('--matrix-dir',
+        help='compute distance matrices into memory-mapped files in given directory (for huge collectives)')
+    binary.add_argument('--matrix-dtype', default='float64', choices=['float64', 'float32', 'uint16', 'uint8'],
+        help='type of values of distance matrix, integer types hold hamming distances (default: float64)')
+    binary.add_argument('--batch', action='store_true',
+        help='generate and evaluate all profiles at once (fast for small profiles, ignores --workers)')
     binary.set_defaults(func=handle_binary_experiments)
 
     euclidean.add_argument('--with_images', action='store_true',
@@ -296,6 +405,31 @@ def main():
     _add_to_all(experiements_types,'--no-db', action='store_true', help='do not save experiments results in db')
     _add_to_all(experiements_types,'--csv', action='store_true', help='write results to CSV file')
     _add_to_all(experiements_types, '--filename', help='specify custom name for output file (works with --csv)')
+    _add_to_all(experiements_types, '--workers', type=int, default=1,
+        help='number of processes running experiments in parallel (default: 1)')
+    _add_to_all(experiements_types, '--seed', type=int,
+        help='master seed, seeds of single runs are derived from it (default: random) - runs of '
+            'the same seed are taken from cache, so only new runs and columns are computed')
+    _add_to_all(experiements_types, '--approximate', type=float, metavar='TOLERANCE',
+        help='estimate c2, c3 and c4 from random samples until confidence interval is within '
+            'given tolerance (for huge collectives, ignored with --batch)')
+    _add_to_all(experiements_types, '--confidence', type=float, default=0.95,
+        help='confidence level of intervals of --approximate (default: 0.95)')
+    _add_to_all(experiements_types, '--no-cache', action='store_true',
+        help='compute all runs, without taking them from (or adding them to) cache of runs')
+
+    export = subparsers.add_parser('export',
+        help='Export stored results to CSV or .npz file (by extension), reading them page by page.')
+    export_types = export.add_subparsers(dest='kind')
+    binary = export_types.add_parser('binary', help='Results of binary experiments')
+    euclidean = export_types.add_parser('euclidean', help='Results of euclidean experiments')
+    _add_to_all(export_types, 'filename', help='name of file in results directory')
+    _add_to_all(export_types, '-n', '--number', type=int, help='export only results for given size of collective')
+    _add_to_all(export_types, '--page-size', type=int, default=RESULTS_PAGE_SIZE,
+        help='number of results read from DB at once (default: %s)' % RESULTS_PAGE_SIZE)
+    binary.add_argument('-l', '--length', type=int, help='export only results for given length of vectors')
+    binary.set_defaults(func=handle_export)
+    euclidean.set_defaults(func=handle_export)
 
     correlations = subparsers.add_parser('correlations', help='get correlations')
     corr_types = correlations.add_subparsers()
@@ -306,6 +440,26 @@ def main():
     binary.set_defaults(func=handle_binary_correlations)
     euclidean.set_defaults(func=handle_euclidean_correlations)
 
+    analysis = subparsers.add_parser('analysis',
+        help='Correlations of all pairs of variables and normality tests for every group of stored results.')
+    analysis_types = analysis.add_subparsers(dest='kind')
+    binary = analysis_types.add_parser('binary', help='Results of binary experiments')
+    euclidean = analysis_types.add_parser('euclidean', help='Results of euclidean experiments')
+    _add_to_all(analysis_types, 'variables', nargs='*',
+        help='analyze only given variables (default: all consistency functions and consensus qualities)')
+    _add_to_all(analysis_types, '--workers', type=int, default=1,
+        help='number of processes analyzing groups in parallel (default: 1)')
+    _add_to_all(analysis_types, '--bootstrap', type=int, default=0, metavar='RESAMPLES',
+        help='add bootstrap confidence intervals of correlations from given number of resamples')
+    _add_to_all(analysis_types, '--confidence', type=float, default=0.95,
+        help='confidence level of bootstrap intervals (default: 0.95)')
+    _add_to_all(analysis_types, '--seed', type=int, default=0,
+        help='seed of bootstrap resamples (default: 0)')
+    _add_to_all(analysis_types, '--no-cache', action='store_true',
+        help='recompute analysis even if stored results have not changed')
+    binary.set_defaults(func=handle_analysis)
+    euclidean.set_defaults(func=handle_analysis)
+
     args = app.parse_args()
     
     try:
@@ -19,6 +19,17 @@ if not os.path.exists(RESULTS_DIR):
 	os.makedirs(RESULTS_DIR)
 
 
+CACHE_DIR = os.path.join(RESULTS_DIR, 'cache')
+if not os.path.exists(CACHE_DIR):
+	os.makedirs(CACHE_DIR)
+
+
+# results of single experiment runs, least recently used are removed above
+# RUNS_CACHE_SIZE bytes
+RUNS_CACHE_DIR = os.path.join(CACHE_DIR, 'runs')
+RUNS_CACHE_SIZE = 256 * 1024 * 1024
+
+
 CSV_DST = RESULTS_DIR
 VIEWS_DIR = 'db_views'
 
@@ -27,6 +38,11 @@ COUCH_DB_HOST = 'localhost'
 COUCH_DB_PORT = '5984'
 
 
+# 'couchdb' or 'sqlite' (local file, no server needed)
+DB_BACKEND = 'couchdb'
+SQLITE_PATH = os.path.join(RESULTS_DIR, 'results.sqlite')
+
+
 db_rev = '2'
 hypothesis_db_rev = '3'
 
@@ -1,22 +1,308 @@
 # coding: utf-8
 
+import os
 import json
+import hashlib
+import sqlite3
+from collections import namedtuple
+
 import couchdb
 from clint.textui import colored, puts
-from consfinder.config import COUCH_DB_HOST, COUCH_DB_PORT, VIEWS_DIR
+from consfinder.config import (COUCH_DB_HOST, COUCH_DB_PORT, VIEWS_DIR, DB_BACKEND, SQLITE_PATH,
+    RUNS_CACHE_DIR, RUNS_CACHE_SIZE)
+
+
+RESULTS_PAGE_SIZE = 100
+
+Row = namedtuple('Row', ['key', 'value'])
+
+
+def view_value(doc):
+    '''Python version of results_all.js - parameters, timestamp and lists of
+    values of every consistency function and consensus algorithm'''
+    results = {'timestamp': doc['timestamp'], 'params': doc['params']}
+    results.update(doc.get('consistency', {}))
+    results.update(doc.get('consensus', {}))
+    return results
+
+
+class ResultsStore(object):
+    '''Storage of experiments results. Documents are saved as built by
+    save_results, results() returns rows of results_all.js view - (key,
+    view_value(doc)), where key is a list of key_params values from doc params.'''
+
+    def __init__(self, key_params):
+        self.key_params = list(key_params)
+
+    def key(self, doc):
+        return [doc['params'].get(p) for p in self.key_params]
+
+    def save(self, doc):
+        self.save_many([doc])
+
+    def save_many(self, docs):
+        '''Saves all docs at once'''
+        raise NotImplementedError()
+
+    def results(self, key=None):
+        '''Returns rows for given key (all rows if key is None)'''
+        return list(self.iter_results(key))
+
+    def iter_results(self, key=None, page_size=RESULTS_PAGE_SIZE):
+        '''Yields rows for given key, fetched in pages of page_size rows'''
+        raise NotImplementedError()
 
+    def version(self):
+        '''Value which changes whenever stored results change'''
+        raise NotImplementedError()
 
-def get_db(db_name):
-    couch = couchdb.Server(url='http://%s:%s' % (COUCH_DB_HOST, COUCH_DB_PORT))
-    try:
-        db = couch[db_name]
-    except:
+
+class CouchDBStore(ResultsStore):
+
+    def __init__(self, db, key_params):
+        super(CouchDBStore, self).__init__(key_params)
+        self.db = db
+
+    def save(self, doc):
+        self.db.save(doc)
+
+    def save_many(self, docs):
+        self.db.update(docs)
+
+    def version(self):
+        return [self.db.name, self.db.info()['update_seq']]
+
+    def _view_rows(self, **kwargs):
         try:
-            db = couch.create(db_name)
+            return self.db.view('results/all', **kwargs).rows
+        except couchdb.http.ResourceNotFound:
+            return self.db.query(load_view('results_all.js'), **kwargs).rows
+
+    def iter_results(self, key=None, page_size=RESULTS_PAGE_SIZE):
+        # the first row of the next page is fetched to get its key and doc id
+        kwargs = {'limit': page_size + 1}
+        if key is not None:
+            kwargs.update(startkey=key, endkey=key)
+        while True:
+            rows = self._view_rows(**kwargs)
+            for row in rows[:page_size]:
+                yield Row(row.key, row.value)
+            if len(rows) <= page_size:
+                return
+            kwargs.update(startkey=rows[-1].key, startkey_docid=rows[-1].id)
+
+
+class SQLiteStore(ResultsStore):
+    '''Results kept in SQLite file, one table per database name. Documents
+    are stored as JSON, key parameters in indexed columns.'''
+    KEY_COLUMNS = ['length', 'n']
+
+    def __init__(self, path, name, key_params):
+        super(SQLiteStore, self).__init__(key_params)
+        if not set(self.key_params) <= set(self.KEY_COLUMNS):
+            raise ValueError('Results can be keyed only by %s' % self.KEY_COLUMNS)
+        self.path = path
+        self.table = name
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY, '
+                'length INTEGER, n INTEGER, timestamp INTEGER, doc TEXT)' % self.table)
+            self.connection.execute('CREATE INDEX IF NOT EXISTS %s_length_n ON %s (length, n)' % (
+                self.table, self.table))
+            self.connection.execute('CREATE INDEX IF NOT EXISTS %s_n ON %s (n)' % (self.table, self.table))
+
+    def save_many(self, docs):
+        rows = [(doc['params'].get('length'), doc['params'].get('n'), doc.get('timestamp'), json.dumps(doc))
+            for doc in docs]
+        with self.connection:
+            self.connection.executemany('INSERT INTO %s (length, n, timestamp, doc) VALUES (?, ?, ?, ?)' % (
+                self.table), rows)
+
+    def version(self):
+        count, last = self.connection.execute('SELECT COUNT(*), MAX(id) FROM %s' % self.table).fetchone()
+        return [os.path.abspath(self.path), self.table, count, last]
+
+    def iter_results(self, key=None, page_size=RESULTS_PAGE_SIZE):
+        columns = self.key_params + ['id']
+        conditions, values = [], []
+        if key is not None:
+            conditions = ['%s = ?' % p for p in self.key_params]
+            values = list(key)
+        last = None
+        while True:
+            # next page starts after the last row in (key, id) order
+            page_conditions = conditions + (['(%s) > (%s)' % (', '.join(columns), ', '.join('?' * len(columns)))]
+                if last is not None else [])
+            query = 'SELECT %s, doc FROM %s' % (', '.join(columns), self.table)
+            if page_conditions:
+                query += ' WHERE ' + ' AND '.join(page_conditions)
+            query += ' ORDER BY %s LIMIT %d' % (', '.join(columns), page_size)
+            rows = self.connection.execute(query, values + (list(last) if last is not None else [])).fetchall()
+            for row in rows:
+                doc = json.loads(row[-1])
+                yield Row(self.key(doc), view_value(doc))
+            if len(rows) < page_size:
+                return
+            last = rows[-1][:-1]
+
+
+class BufferedWriter(object):
+    '''Collects documents and saves them to store in bulks of size documents
+    (CouchDB - one _bulk_docs request per bulk). Use as context manager or
+    call flush() at the end.'''
+
+    def __init__(self, store, size=100):
+        self.store = store
+        self.size = size
+        self.docs = []
+
+    def add(self, doc):
+        self.docs.append(doc)
+        if len(self.docs) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.docs:
+            self.store.save_many(self.docs)
+            self.docs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+
+class RunCache(object):
+    '''Content-addressed cache of results of single experiment runs. Entry of
+    a run is JSON file named by md5 of its key (list of run parameters) with
+    values of columns computed so far. The total size of entries is counted
+    once and then kept up to date by writes - when it exceeds max_size, least
+    recently used entries are removed down to EVICT_TO of max_size, so
+    eviction does not run on every following write.'''
+    EVICT_TO = 0.9
+
+    def __init__(self, path=RUNS_CACHE_DIR, max_size=RUNS_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.size = None
+
+    def _file(self, key):
+        digest = hashlib.md5(json.dumps(key)).hexdigest()
+        return os.path.join(self.path, digest[:2], '%s.json' % digest)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _entries(self):
+        '''Returns list of (last use time, size, path) of all entries'''
+        entries = []
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        '''Returns dict of cached columns of run (empty if there are none)'''
+        path = self._file(key)
+        values = self._read(path)
+        if values:
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return values
+
+    def update(self, key, values):
+        '''Adds values (dict) to cached columns of run'''
+        path = self._file(key)
+        cached = self._read(path)
+        cached.update(values)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(cached, f)
+        new_size = os.path.getsize(tmp_path)
+        os.rename(tmp_path, path)
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._entries())
+        else:
+            self.size += new_size - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''Removes least recently used entries until the cache fits in EVICT_TO
+        of max_size bytes, returns the number of removed entries'''
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_size * self.EVICT_TO:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+        return removed
+
+
+_couch_servers = {}
+_couch_dbs = {}
+
+def get_couch_server():
+    '''Returns couchdb.Server shared within the process (its HTTP session
+    keeps connections open between requests)'''
+    key = (os.getpid(), COUCH_DB_HOST, COUCH_DB_PORT)
+    if key not in _couch_servers:
+        _couch_servers[key] = couchdb.Server(url='http://%s:%s' % (COUCH_DB_HOST, COUCH_DB_PORT))
+    return _couch_servers[key]
+
+
+def get_couchdb(db_name):
+    '''Returns database of shared server, created if it does not exist. The
+    database is looked up once per process.'''
+    key = (os.getpid(), db_name)
+    if key not in _couch_dbs:
+        couch = get_couch_server()
+        try:
+            db = couch[db_name]
         except:
-            puts(colored.red('No CouchDB connection'))
-            db = None
-    return db
+            try:
+                db = couch.create(db_name)
+            except:
+                puts(colored.red('No CouchDB connection'))
+                return None
+        _couch_dbs[key] = db
+    return _couch_dbs[key]
+
+
+def get_db(db_name, key_params=('length', 'n'), backend=None):
+    '''Returns ResultsStore of given backend ('couchdb' or 'sqlite', default
+    DB_BACKEND from config) or None if it is not available'''
+    backend = backend or DB_BACKEND
+    if backend == 'sqlite':
+        return SQLiteStore(SQLITE_PATH, db_name, key_params)
+    db = get_couchdb(db_name)
+    return CouchDBStore(db, key_params) if db is not None else None
 
 
 def load_view(filename):
@@ -2,22 +2,37 @@
 
 import os
 import csv
+import json
 import time
+import hashlib
+import warnings
+import zipfile
+import multiprocessing
+from cStringIO import StringIO
 from collections import OrderedDict
 from functools import wraps
+from itertools import izip_longest
+from contextlib import contextmanager
 
-import couchdb
+import numpy
 from clint.textui import progress, puts, colored
 
-from consfinder.profiles import BinaryProfile
-from consfinder.functions import ConsensusO1, ConsensusO2, OptimalAlgorithm, CONSENSUS_ALGORITHMS
-from consfinder.config import (CSV_DST, EXPERIMENTS_DB_NAME, HYPOTHESIS_DB_NAME, ARTICLE_EXPERIMENTS_DB)
-from consfinder.databases import get_db, load_view
-from consfinder.scripts.hypothesis import (EuclideanProfile, get_rand_radius,
+from consfinder.profiles import BinaryProfile, BinaryProfileBatch, ProfileStatistics, SampledStatistics
+from consfinder.functions import (ConsensusO1, ConsensusO2, OptimalAlgorithm, CONSENSUS_ALGORITHMS,
+    DEFAULT_ALGORITHMS)
+from consfinder.config import (CSV_DST, CACHE_DIR, EXPERIMENTS_DB_NAME, HYPOTHESIS_DB_NAME,
+    ARTICLE_EXPERIMENTS_DB)
+from consfinder.databases import get_db, BufferedWriter, RunCache, RESULTS_PAGE_SIZE
+from consfinder.utils import new_seed, derive_seeds
+from consfinder.scripts.hypothesis import (EuclideanProfile, EuclideanConsensusO2, get_rand_radius,
     euclidean_distance, REAL_STATE)
 
 
 CONSISTENCY_FUNCTIONS = ['c1', 'c2', 'c3', 'c4', 'c5']
+NAN = float('nan')
+SAMPLED_FUNCTIONS = ['c2', 'c3', 'c4']
+# bump when consistency measures change (all cached runs are recomputed)
+RUNS_VERSION = 2
 
 
 def with_db(f):
@@ -32,37 +47,277 @@ def with_db(f):
     return __inner
 
 
-class ExperimentsManager(object):
-
-    def __init__(self):
-        self.db = get_db(EXPERIMENTS_DB_NAME)
-
-    def run_experiment(self, count, number, length, functions=CONSISTENCY_FUNCTIONS, algorithms=CONSENSUS_ALGORITHMS, no_db=False, *args, **kwargs):
-        results = {'params': {'n': number, 'length': length}, 'data':[]}
-        for no in progress.bar(range(1, count + 1)):
-            single_res = OrderedDict()
-            single_res['no'] = no
-
-            profile = BinaryProfile(n=number, length=length)
-            profile.generate()
-            
-            for func_name in functions:
-                func = getattr(profile, func_name)
-                single_res[func_name] = func()
+def map_runs(func, tasks, workers=1):
+    '''Returns [func(task) for task in tasks], computed in a pool of worker
+    processes if workers > 1. Order of results is the order of tasks.'''
+    if not workers or workers < 2:
+        return [func(task) for task in progress.bar(tasks)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = list(progress.bar(pool.imap(func, tasks), expected_size=len(tasks)))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def best_quality(profile, alg_name, consensus=None):
+    '''Quality of the best consensus element of algorithm (computed unless
+    consensus is given). Algorithms with run_top keep only the best element.'''
+    alg = CONSENSUS_ALGORITHMS[alg_name]
+    if consensus is None:
+        consensus = alg.run_top(profile) if hasattr(alg, 'run_top') else alg.run(profile)
+    if getattr(consensus, 'best_quality', None) is not None:
+        return consensus.best_quality
+    return max([profile.quality(con) for con in consensus])
+
+
+def compute_measures(profile, seed, functions, algorithms=[], tolerance=None, confidence=0.95):
+    '''Returns (measures, ProfileStatistics) for profile. With tolerance c2, c3
+    and c4 are estimated from samples (see SampledStatistics) and half widths
+    of their confidence intervals are added as <function>_error.'''
+    sampled = [f for f in functions if f in SAMPLED_FUNCTIONS] if tolerance else []
+    stats = ProfileStatistics(profile, [f for f in functions if f not in sampled], algorithms, top=1)
+    measures = OrderedDict()
+    if sampled:
+        estimates = SampledStatistics(profile, sampled, tolerance, confidence, seed=derive_seeds(seed, 1)[0])
+        for f in functions:
+            measures[f] = stats.measures[f] if f in stats.measures else estimates.measures[f]
+        for f, error in estimates.errors().iteritems():
+            measures['%s_error' % f] = error
+    else:
+        measures.update(stats.measures)
+    return measures, stats
+
+
+def measure_columns(functions, tolerance=None):
+    '''Names of result columns of consistency functions, estimated ones have
+    also <function>_error column'''
+    columns = list(functions)
+    if tolerance:
+        columns.extend('%s_error' % f for f in functions if f in SAMPLED_FUNCTIONS)
+    return columns
+
+
+def run_cached(cache, keys, columns, compute):
+    '''Results of runs with given cache keys - list of OrderedDicts with values
+    of columns (OrderedDict of column name -> its id in cache). Only missing
+    values are computed: compute(missing) gets list of (run index, names of
+    missing columns) and returns results of these runs. Without cache
+    (None) everything is computed.'''
+    cached = [cache.get(key) if cache is not None else {} for key in keys]
+    missing = [(i, [c for c, cid in columns.iteritems() if cid not in values])
+        for i, values in enumerate(cached)]
+    missing = [(i, names) for i, names in missing if names]
+    if cache is not None and len(missing) < len(keys):
+        puts(colored.green('%s of %s runs taken from cache' % (len(keys) - len(missing), len(keys))))
+    if missing:
+        for (i, _), single_res in zip(missing, compute(missing)):
+            values = dict((cid, single_res[c]) for c, cid in columns.iteritems() if c in single_res)
+            cached[i].update(values)
+            if cache is not None:
+                cache.update(keys[i], values)
+    data = []
+    for i, values in enumerate(cached):
+        single_res = OrderedDict()
+        single_res['no'] = i + 1
+        for c, cid in columns.iteritems():
+            single_res[c] = values[cid]
+        data.append(single_res)
+    return data
+
+
+def _with_p_values(r, n):
+    '''Two-sided p-values of correlation coefficients r of n pairs (t-test,
+    as in scipy.stats.pearsonr)'''
+    from scipy.stats import t as t_dist
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = r * numpy.sqrt((n - 2) / ((1.0 - r) * (1.0 + r)))
+    return 2 * t_dist.sf(numpy.abs(t), n - 2)
+
+
+def _ranks(data):
+    '''Ranks of values in every column of data (ties get average rank)'''
+    from scipy.stats import rankdata
+    return numpy.column_stack([rankdata(column) for column in data.T])
+
+
+def _correlation_matrices(data):
+    '''Pearson correlation matrix of columns of data for every matrix of
+    the (..., runs, variables) stack'''
+    centered = data - data.mean(-2)[..., numpy.newaxis, :]
+    covariance = numpy.einsum('...ij,...ik->...jk', centered, centered)
+    deviations = numpy.sqrt(numpy.einsum('...jj->...j', covariance))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        r = covariance / deviations[..., :, numpy.newaxis] / deviations[..., numpy.newaxis, :]
+        return numpy.clip(r, -1, 1, out=r)
+
+
+def _percentile_intervals(samples, tails):
+    '''Percentiles tails of every correlation in (resamples, k, k) stack,
+    resamples where it is NaN are left out'''
+    k = samples.shape[1]
+    result = numpy.empty((k, k, len(tails)))
+    for i in xrange(k):
+        for j in xrange(k):
+            values = samples[:, i, j]
+            values = values[~numpy.isnan(values)]
+            result[i, j] = [numpy.percentile(values, t) for t in tails] if len(values) else NAN
+    return result
+
+
+def analyze_group(task):
+    '''Statistics of one group of runs - task is a tuple of (key, names,
+    data, bootstrap, confidence, seed), where data is (runs, variables) array.
+    Returns dict with Spearman and Pearson correlation matrices of all pairs
+    of variables with p-values, Shapiro-Wilk test of every variable and,
+    with bootstrap > 0, percentile confidence intervals of correlations from
+    bootstrap resamples of runs.'''
+    from scipy.stats import shapiro
+    key, names, data, bootstrap, confidence, seed = task
+    runs = len(data)
+    result = {'key': key, 'names': names, 'runs': runs}
+    # constant variables (e.g. quality of the optimal algorithm) have no
+    # correlations, they are NaN without warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for name, values in [('pearson', data), ('spearman', _ranks(data))]:
+            r = _correlation_matrices(values)
+            result[name] = r.tolist()
+            result['%s_p' % name] = _with_p_values(r, runs).tolist()
+        result['shapiro'] = [list(shapiro(column)) if runs >= 3 else [NAN, NAN] for column in data.T]
+        if bootstrap:
+            samples = data[numpy.random.RandomState(seed).randint(0, runs, (bootstrap, runs))]
+            tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+            for name, values in [('pearson', samples), ('spearman', numpy.array([_ranks(s) for s in samples]))]:
+                result['%s_ci' % name] = _percentile_intervals(_correlation_matrices(values), tails).tolist()
+    return result
+
+
+def run_binary_single(task):
+    '''Single run of binary experiment - task is a tuple of
+    (no, seed, number, length, functions, algorithms, matrix_dir, matrix_dtype,
+    tolerance, confidence). With matrix_dir the distance matrix is kept in a
+    memory-mapped file there, with tolerance c2-c4 are estimated from samples.'''
+    no, seed, number, length, functions, algorithms, matrix_dir, matrix_dtype, tolerance, confidence = task
+    single_res = OrderedDict()
+    single_res['no'] = no
+
+    matrix_file = None
+    if matrix_dir:
+        matrix_file = os.path.join(matrix_dir, 'matrix_%s_%s.dat' % (os.getpid(), no))
+    profile = BinaryProfile(n=number, length=length, matrix_file=matrix_file, matrix_dtype=matrix_dtype)
+    profile.generate(seed=seed)
+
+    try:
+        measures, stats = compute_measures(profile, seed, functions, algorithms, tolerance, confidence)
+        single_res.update(measures)
+
+        for alg_name in algorithms:
+            single_res[alg_name] = best_quality(profile, alg_name, stats.consensus.get(alg_name))
+    finally:
+        if matrix_file:
+            profile.init_empty()
+            if os.path.exists(matrix_file):
+                os.remove(matrix_file)
+    return single_res
+
+
+def run_binary_batch(seeds, number, length, functions, algorithms):
+    '''All runs of binary experiment at once - profiles are generated and
+    evaluated as one BinaryProfileBatch. Algorithms without run_batch are
+    run for every profile separately.'''
+    batch = BinaryProfileBatch(len(seeds), number, length)
+    batch.generate(seeds)
+    columns = OrderedDict()
+    for func_name in functions:
+        columns[func_name] = getattr(batch, func_name)().tolist()
+    for alg_name in algorithms:
+        alg = CONSENSUS_ALGORITHMS[alg_name]
+        if hasattr(alg, 'run_batch'):
+            columns[alg_name] = batch.quality(alg.run_batch(batch)).tolist()
+        else:
+            columns[alg_name] = []
+            for i in progress.bar(range(len(seeds)), label='%s ' % alg_name):
+                columns[alg_name].append(best_quality(batch.profile(i), alg_name))
+
+    data = []
+    for i in xrange(len(seeds)):
+        single_res = OrderedDict()
+        single_res['no'] = i + 1
+        for name, values in columns.iteritems():
+            single_res[name] = values[i]
+        data.append(single_res)
+    return data
+
+
+def write_npz_from_db(results, filepath):
+    '''Writes results (iterable of view values) to .npz file, one by one - i-th
+    result is stored as arrays named <i>_<field> and <i>_params (JSON)'''
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for i, single_res in enumerate(results):
+            arrays = {'params': numpy.array(json.dumps(single_res['params']))}
+            for field, values in single_res.iteritems():
+                if field not in ('timestamp', 'params'):
+                    arrays[field] = numpy.asarray(values)
+            for field, array in arrays.iteritems():
+                buf = StringIO()
+                numpy.lib.format.write_array(buf, array)
+                archive.writestr('%s_%s.npy' % (i, field), buf.getvalue())
 
-            for alg_name in algorithms:
-                alg = CONSENSUS_ALGORITHMS[alg_name]
-                single_res[alg_name] = max([profile.quality(con) for con in alg.run(profile)])
 
-            results['data'].append(single_res)
+class ExperimentsManager(object):
+    DB_NAME = EXPERIMENTS_DB_NAME
+    DB_KEY = ['length', 'n']
+
+    def __init__(self, backend=None):
+        self.db = get_db(self.DB_NAME, self.DB_KEY, backend)
+        self.writer = None
+        self.cache = RunCache()
+
+    def run_experiment(self, count, number, length, functions=CONSISTENCY_FUNCTIONS, algorithms=DEFAULT_ALGORITHMS, no_db=False, workers=1, seed=None, batch=False, matrix_dir=None, matrix_dtype='float64', approximate=None, confidence=0.95, no_cache=False, *args, **kwargs):
+        '''Runs count experiments, every run generates profile from its own seed
+        derived from the master seed (random if not given). Results of runs are
+        cached by their seed and parameters, only missing values are computed.'''
+        if seed is None:
+            seed = new_seed()
+        results = {'params': {'n': number, 'length': length, 'seed': seed}, 'data':[]}
+        if batch:
+            approximate = None
+        if approximate:
+            results['params']['tolerance'] = approximate
+        seeds = derive_seeds(seed, count)
+        functions, algorithms = list(functions), list(algorithms)
+        measures = measure_columns(functions, approximate)
+        columns = OrderedDict((c, c) for c in measures)
+        columns.update((a, '%s@%s' % (a, CONSENSUS_ALGORITHMS[a].version)) for a in algorithms)
+        keys = [['binary', number, length, run_seed, RUNS_VERSION, matrix_dtype, approximate,
+            confidence if approximate else None] for run_seed in seeds]
+
+        def compute(missing):
+            # functions are missing also when only their error columns are
+            missing_functions = [[f for f in functions if f in names or '%s_error' % f in names]
+                for _, names in missing]
+            missing_algorithms = [[a for a in algorithms if a in names] for _, names in missing]
+            if batch:
+                return run_binary_batch([seeds[i] for i, _ in missing], number, length,
+                    [f for f in functions if any(f in m for m in missing_functions)],
+                    [a for a in algorithms if any(a in m for m in missing_algorithms)])
+            tasks = [(i + 1, seeds[i], number, length, f, a, matrix_dir, matrix_dtype, approximate, confidence)
+                for (i, _), f, a in zip(missing, missing_functions, missing_algorithms)]
+            return map_runs(run_binary_single, tasks, workers)
+
+        results['data'] = run_cached(None if no_cache else self.cache, keys, columns, compute)
 
         if not no_db:
             self.save_results(results, functions, algorithms)
 
         return results
 
-    @with_db
-    def save_results(self, results, functions, algorithms):
+    def results_doc(self, results, functions, algorithms):
         doc = {'params': results['params']}
         doc['timestamp'] = int(time.time())
         doc['consistency'] = {}
@@ -71,28 +326,61 @@ class ExperimentsManager(object):
             doc['consistency'][f] = map(lambda single_res: single_res[f], results['data'])
         for q in algorithms:
             doc['consensus'][q] = map(lambda single_res: single_res[q], results['data'])
-        self.db.save(doc)
-        print "Saved in DB"
+        return doc
+
+    @with_db
+    def save_results(self, results, functions, algorithms):
+        doc = self.results_doc(results, functions, algorithms)
+        if self.writer is not None:
+            self.writer.add(doc)
+        else:
+            self.db.save(doc)
+            print "Saved in DB"
+
+    @contextmanager
+    def bulk(self, size=100):
+        '''Within the block results are saved in bulks of size experiments'''
+        self.writer = BufferedWriter(self.db, size) if self.db else None
+        try:
+            yield self.writer
+        finally:
+            if self.writer is not None:
+                self.writer.flush()
+            self.writer = None
 
     def write_to_csv_from_db(self, results, filename):
+        '''Writes results (iterable of view values, e.g. from get_results) to
+        CSV file one by one'''
         filepath = os.path.join(CSV_DST, filename)
         with open(filepath, 'ar') as f:
             writer = csv.writer(f, delimiter=';')
             for single_res in results:
-                del single_res['timestamp']
-                params = single_res.pop('params')
+                params = single_res['params']
                 writer.writerow(['%s: %s' % (k,v) for k,v in params.iteritems()])
 
-                fields = sorted(single_res.keys())
-                results_num = len(single_res[fields[0]])
-
+                fields = sorted(k for k in single_res.keys() if k not in ('timestamp', 'params'))
                 writer.writerow([k for k in fields])
-                for i in range(results_num):
-                    row = [str(single_res[field][i]).replace('.', ',') for field in fields]
-                    # row = [str(single_res[field][i]) for field in fields]
-                    writer.writerow(row)
+                columns = [[str(v).replace('.', ',') for v in single_res[field]] for field in fields]
+                # results missing values of a field get empty cells, rows are not cut
+                writer.writerows(izip_longest(*columns, fillvalue=''))
                 writer.writerow('\n')
 
+    @with_db
+    def export_results(self, filename, key=None, page_size=RESULTS_PAGE_SIZE):
+        '''Writes stored results (for given view key or all of them) to CSV or
+        .npz file, reading them from DB in pages of page_size documents.
+        Returns the number of exported documents.'''
+        exported = [0]
+        def values():
+            for row in self.db.iter_results(key, page_size):
+                exported[0] += 1
+                yield row.value
+        if filename.endswith('.npz'):
+            write_npz_from_db(values(), os.path.join(CSV_DST, filename))
+        else:
+            self.write_to_csv_from_db(values(), filename)
+        return exported[0]
+
     def write_to_csv(self, results, filename):
         filepath = os.path.join(CSV_DST, filename)
         with open(filepath, 'ar') as f:
@@ -109,18 +397,18 @@ class ExperimentsManager(object):
     def get_correlations(self, x, y):
         from scipy.stats.stats import spearmanr, pearsonr
         correlations = []
-        rows = self.db.view('results/all').rows
+        rows = self.db.results()
         for row in rows:
-            x_values = row['value'].get(x)
-            y_values = row['value'].get(y)
+            x_values = row.value.get(x)
+            y_values = row.value.get(y)
             correlations.append((row.key, spearmanr(x_values, y_values), pearsonr(x_values, y_values)))
         return correlations
 
     def _get_single_param_values(self, param):
         results = []
-        rows = self.db.view('results/all').rows
+        rows = self.db.results()
         for row in rows:
-            values = row['value'].get(param)
+            values = row.value.get(param)
             results.append((row.key, values))
         return results
 
@@ -133,90 +421,112 @@ class ExperimentsManager(object):
             results.append((key, shapiro(sorted(values))))
         return results
 
-    def _get_results(self, startkey, endkey):
-        results = []
-        try:
-            try:
-                results = self.db.view('results/all', startkey=startkey, endkey=endkey)
-            except couchdb.http.ResourceNotFound:
-                view = load_view('results_all.js')
-                results = self.db.query(view, startkey=startkey, endkey=endkey)
-            finally:
-                if results:
-                    results = [row.value for row in results]
-        except IndexError:
-            pass
-        return results
-
     @with_db
     def get_results(self, length, n):
-        startkey = endkey = [length, n]
-        return self._get_results(startkey, endkey)
+        return [row.value for row in self.db.results([length, n])]
+
+    def _analysis_groups(self, names=None):
+        '''Yields (key, names, data) - values of variables of all runs stored
+        under every view key, as (runs, variables) array. Variables are all
+        consistency functions and consensus qualities present in every result
+        of the group (or given names).'''
+        groups = OrderedDict()
+        for row in self.db.iter_results():
+            groups.setdefault(tuple(row.key), []).append(row.value)
+        for key, results in groups.iteritems():
+            common = set.intersection(*[set(r.keys()) for r in results]) - set(['timestamp', 'params'])
+            if names is not None:
+                common &= set(names)
+            ordered = [f for f in CONSISTENCY_FUNCTIONS if f in common] + sorted(common - set(CONSISTENCY_FUNCTIONS))
+            data = numpy.column_stack([numpy.concatenate([r[f] for r in results]).astype(float)
+                for f in ordered]) if ordered else numpy.zeros((0, 0))
+            yield list(key), ordered, data
 
+    @with_db
+    def get_analysis(self, names=None, bootstrap=0, confidence=0.95, seed=0, workers=1, use_cache=True):
+        '''Correlation matrices and normality tests (see analyze_group) for
+        every group of runs with the same view key, groups are analyzed in
+        parallel. Output is cached until the stored results change.'''
+        options = [self.db.version(), sorted(names) if names else None, bootstrap, confidence, seed]
+        digest = hashlib.md5(json.dumps(options)).hexdigest()
+        path = os.path.join(CACHE_DIR, 'analysis_%s.json' % digest)
+        if use_cache and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        tasks = [(key, group_names, data, bootstrap, confidence, seed)
+            for key, group_names, data in self._analysis_groups(names) if len(group_names)]
+        results = map_runs(analyze_group, tasks, workers)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(results, f)
+        os.rename(tmp_path, path)
+        return results
 
-class EuclideanExperimetsManager(ExperimentsManager):
 
-    def __init__(self, *args, **kwargs):
-        super(EuclideanExperimetsManager, self).__init__(*args, **kwargs)
-        self.db = get_db(HYPOTHESIS_DB_NAME)
+def run_euclidean_single(task):
+    '''Single run of euclidean experiment - task is a tuple of
+    (no, seed, number, functions, no_equal, with_images, tolerance, confidence,
+    consensus), without consensus only consistency functions are computed'''
+    no, seed, number, functions, no_equal, with_images, tolerance, confidence, consensus = task
+    single_res = OrderedDict()
+    single_res['no'] = no
+
+    profile = EuclideanProfile(n=number)
+    profile.generate(equal_dist=not no_equal, seed=seed)
+    single_res.update(compute_measures(profile, seed, functions, tolerance=tolerance, confidence=confidence)[0])
+    if not consensus:
+        return single_res
 
-    def run_experiment(self, count, number, functions=['c1', 'c2', 'c3', 'c4', 'c5'], no_db=False, with_images=False, no_equal=False, *args, **kwargs):
-        shared_universe = []
-        shared_perimeter = []
+    o2 = EuclideanConsensusO2.run(profile)
+    best_i, best_q = max([(i, profile.quality(con)) for i, con in enumerate(o2)], key=lambda x:x[1])
+    best_el = o2[best_i]
+    single_res[ConsensusO2.name] = best_q
+    single_res['dist_from_real'] = euclidean_distance(best_el, REAL_STATE)
+    if with_images:
+        profile.save_fig(extra=[best_el], name_suffix=str(no))
+    return single_res
 
-        def get_o2_consensus(profile):
-            o2 = ConsensusO2.run(profile)
-            best_i, best_q = max([(i, profile.quality(con)) for i, con in enumerate(o2)], key=lambda x:x[1])
-            best_el = o2[best_i]
-            dist = euclidean_distance(best_el, REAL_STATE)
-            return best_q, dist, best_el
 
+class EuclideanExperimetsManager(ExperimentsManager):
+    DB_NAME = HYPOTHESIS_DB_NAME
+    DB_KEY = ['n']
+
+    def run_experiment(self, count, number, functions=['c1', 'c2', 'c3', 'c4', 'c5'], no_db=False, with_images=False, no_equal=False, workers=1, seed=None, approximate=None, confidence=0.95, no_cache=False, *args, **kwargs):
+        if seed is None:
+            seed = new_seed()
         radius = 1
-        results = {'params': {'n': number, 'radius': radius}, 'data':[]}
-
-        for no in progress.bar(range(1, count + 1)):
-            single_res = OrderedDict()
-            single_res['no'] = no
-
-            profile = EuclideanProfile(n=number, universe=shared_universe, perimeter=shared_perimeter)
-            profile.generate(equal_dist=not no_equal)
-
-            if not (shared_universe and shared_perimeter):
-                shared_universe = profile.universe
-                shared_perimeter = profile.perimeter
-            
-            for func_name in functions:
-                func = getattr(profile, func_name)
-                single_res[func_name] = func()
-            best_q, dist, best_el = get_o2_consensus(profile)
-            single_res[ConsensusO2.name] = best_q
-            single_res['dist_from_real'] = dist
-            results['data'].append(single_res)
-            if with_images:
-                profile.save_fig(extra=[best_el], name_suffix=str(no))
+        results = {'params': {'n': number, 'radius': radius, 'seed': seed}, 'data':[]}
+        if approximate:
+            results['params']['tolerance'] = approximate
+        seeds = derive_seeds(seed, count)
+        functions = list(functions)
+        columns = OrderedDict((c, c) for c in measure_columns(functions, approximate))
+        columns[ConsensusO2.name] = '%s@%s' % (EuclideanConsensusO2.name, EuclideanConsensusO2.version)
+        columns['dist_from_real'] = 'dist_from_real@%s' % EuclideanConsensusO2.version
+        keys = [['euclidean', number, 2, run_seed, RUNS_VERSION, radius, not no_equal, approximate,
+            confidence if approximate else None] for run_seed in seeds]
+
+        def compute(missing):
+            tasks = [(i + 1, seeds[i], number, [f for f in functions if f in names or '%s_error' % f in names],
+                no_equal, with_images, approximate, confidence, ConsensusO2.name in names or 'dist_from_real' in names)
+                for i, names in missing]
+            return map_runs(run_euclidean_single, tasks, workers)
+
+        # images are drawn from generated profiles, so all runs are computed
+        results['data'] = run_cached(None if no_cache or with_images else self.cache, keys, columns, compute)
 
         if not no_db:
             self.save_results(results, functions, algorithms=[ConsensusO2.name])
         return results
 
-    @with_db
-    def save_results(self, results, functions, algorithms):
-        doc = {'params': results['params']}
-        doc['timestamp'] = int(time.time())
-        doc['consistency'] = {}
-        doc['consensus'] = {}
-        for f in functions:
-            doc['consistency'][f] = map(lambda single_res: single_res[f], results['data'])
-        for q in algorithms:
-            doc['consensus'][q] = map(lambda single_res: single_res[q], results['data'])
+    def results_doc(self, results, functions, algorithms):
+        doc = super(EuclideanExperimetsManager, self).results_doc(results, functions, algorithms)
         doc['distances'] = map(lambda single_res: single_res['dist_from_real'], results['data'])
-        self.db.save(doc)
-        print "Saved in DB"
+        return doc
 
     @with_db
     def get_results(self, n):
-        startkey = endkey = [n]
-        return self._get_results(startkey, endkey)
+        return [row.value for row in self.db.results([n])]
 
 
 MANAGERS_MAP = {
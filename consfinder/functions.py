@@ -1,10 +1,18 @@
 # coding: utf-8
 
+import time
+import heapq
 from math import sqrt
+from itertools import product, islice, izip, repeat
+
+import numpy
 from clint.textui import progress
 from consfinder.config import FLOAT_PRECISION
 
 
+POPCOUNT_TABLE = numpy.array([bin(i).count('1') for i in xrange(256)], dtype=numpy.uint8)
+
+
 def minmax(x, min_, max_):
     return (x - min_) / (max_ - min_)
 
@@ -24,60 +32,609 @@ def euclidean_distance_norm(vector_x, vector_y, min_, max_):
     return minmax(dist, min_, max_)
 
 
+def _as_2d_arrays(elements_x, elements_y):
+    x = numpy.asarray(elements_x)
+    y = numpy.asarray(elements_y)
+    if x.ndim != 2 or y.ndim != 2:
+        raise ValueError('Distance matrix can be calculated only for 2-D arrays of vectors')
+    if x.shape[1] != y.shape[1]:
+        raise ValueError('Cannot calculate distance for vectors of different length')
+    return x, y
+
+
+def pack_binary(elements):
+    '''Packs 2-D array of 0/1 vectors into rows of uint8 words (8 bits per word)'''
+    return numpy.packbits(numpy.asarray(elements, dtype=numpy.uint8), axis=1)
+
+
+def unpack_binary(packed, length):
+    '''Reverse of pack_binary - returns 2-D array of 0/1 vectors of given length'''
+    return numpy.unpackbits(packed, axis=1)[:, :length]
+
+
+def unique_rows(array):
+    '''Returns distinct rows of 2-D array (sorted), the number of occurrences
+    of each of them and indices of distinct row for every row of array'''
+    array = numpy.asarray(array)
+    if not len(array):
+        return array, numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    order = numpy.lexsort(array.T[::-1])
+    sorted_ = array[order]
+    is_new = numpy.ones(len(array), dtype=bool)
+    is_new[1:] = (sorted_[1:] != sorted_[:-1]).any(axis=1)
+    groups = numpy.cumsum(is_new) - 1
+    inverse = numpy.empty(len(array), dtype=int)
+    inverse[order] = groups
+    return sorted_[is_new], numpy.bincount(groups), inverse
+
+
+def hamming_dist_matrix(packed_x, packed_y):
+    '''Number of differing bits between every row of packed_x and every row
+    of packed_y (XOR + popcount on packed words)'''
+    x, y = _as_2d_arrays(packed_x, packed_y)
+    result = numpy.zeros((len(x), len(y)), dtype=numpy.int64)
+    for i in xrange(x.shape[1]):
+        result += POPCOUNT_TABLE[numpy.bitwise_xor(x[:, i, numpy.newaxis], y[:, i])]
+    return result
+
+
+def hamming_pair_dist(packed_x, packed_y):
+    '''Number of differing bits between corresponding rows of packed_x and packed_y'''
+    x, y = _as_2d_arrays(packed_x, packed_y)
+    return POPCOUNT_TABLE[numpy.bitwise_xor(x, y)].sum(1, dtype=numpy.int64)
+
+
+def euclidean_distance_matrix(elements_x, elements_y):
+    '''Batched euclidean_distance - matrix of distances between every row of
+    elements_x and every row of elements_y'''
+    x, y = _as_2d_arrays(elements_x, elements_y)
+    result = numpy.zeros((len(x), len(y)))
+    for i in xrange(x.shape[1]):
+        result += (x[:, i, numpy.newaxis] - y[:, i]) ** 2
+    return numpy.sqrt(result)
+
+
+def euclidean_distance_norm_matrix(elements_x, elements_y, min_, max_):
+    dist = euclidean_distance_matrix(elements_x, elements_y)
+    return minmax(dist, min_, max_)
+
+
+class ConsensusSet(object):
+    '''Lazy set of consensus candidates - cartesian product of allowed values
+    in every column, iterated in the same order as the universe'''
+
+    exhaustive = True
+
+    def __init__(self, choices):
+        self.choices = [tuple(c) for c in choices]
+
+    @property
+    def size(self):
+        return reduce(lambda acc, c: acc * len(c), self.choices, 1)
+
+    def __iter__(self):
+        return product(*self.choices)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('consensus index out of range')
+        element = []
+        for c in reversed(self.choices):
+            index, i = divmod(index, len(c))
+            element.append(c[i])
+        return tuple(reversed(element))
+
+
+class ConsensusResult(list):
+    '''List of consensus elements. exhaustive is False if the search was
+    stopped before it was complete - elements are the best found so far.'''
+
+    def __init__(self, elements=(), exhaustive=True):
+        super(ConsensusResult, self).__init__(elements)
+        self.exhaustive = exhaustive
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class ProgressCallback(object):
+    '''Receives progress of consensus search - number of candidates checked
+    so far and the expected number of them (None if not known)'''
+
+    def update(self, done, total):
+        pass
+
+    def finish(self, done, total):
+        pass
+
+
+class ProgressBar(ProgressCallback):
+    '''Progress of consensus search shown as clint progress bar, in percents
+    of the expected number of candidates'''
+
+    def __init__(self, label=''):
+        self.label = label
+        self.bar = None
+        self.shown = 0
+
+    def _percents(self):
+        while self.bar is not None:
+            yield self.shown
+
+    def _show(self, percent):
+        # progress.bar shows the number of items taken so far - the next one
+        # is taken only to show the previous one
+        while self.shown < percent:
+            self.shown += 1
+            next(self.bar)
+
+    def update(self, done, total):
+        if total is None:
+            return
+        if self.bar is None:
+            self.shown = 0
+            self.bar = progress.bar(self._percents(), label=self.label, expected_size=100)
+            next(self.bar)
+        self._show(min(100, 100 * done // total) - 1)
+
+    def finish(self, done, total):
+        if self.bar is not None:
+            self._show(min(100, 100 * done // total) - 1)
+            bar, self.bar = self.bar, None
+            for _ in bar:
+                pass
+
+
+class SearchControl(object):
+    '''Budget of consensus search - time_limit in seconds and/or max_iterations
+    candidates, callback (ProgressCallback) informed every `every` candidates.
+    cancel() stops the search, also from the callback or another thread.
+    With interruptible Ctrl-C stops the search instead of the program.'''
+
+    def __init__(self, time_limit=None, max_iterations=None, callback=None, every=1000,
+            interruptible=False):
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.callback = callback or ProgressCallback()
+        self.every = every
+        self.interruptible = interruptible
+        self.total = None
+        self.started = None
+        self.cancelled = False
+
+    def start(self, total=None):
+        self.total = total
+        self.started = time.time()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def step(self, done):
+        '''Returns False if the search should stop after done candidates'''
+        if self.max_iterations is not None and done >= self.max_iterations:
+            return False
+        if done % self.every:
+            return not self.cancelled
+        self.callback.update(done, self.total)
+        if self.time_limit is not None and time.time() - self.started >= self.time_limit:
+            return False
+        return not self.cancelled
+
+    def finish(self, done):
+        self.callback.finish(done, self.total)
+
+    def run(self, items, func, total=None):
+        '''Calls func(item) for items until the budget is exhausted or the
+        search is cancelled. Returns True if all items were processed.'''
+        self.start(total)
+        done = 0
+        try:
+            for item in items:
+                func(item)
+                done += 1
+                if not self.step(done):
+                    return done == total
+            return True
+        except KeyboardInterrupt:
+            if not self.interruptible:
+                raise
+            return False
+        finally:
+            self.finish(done)
+
+
+def default_control(profile):
+    '''SearchControl without budget, showing progress bar unless profile
+    hides progress'''
+    return SearchControl(callback=None if profile.hide_progress else ProgressBar())
+
+
+class ConsensusCollector(object):
+    '''Collects elements x with minimal d(x,X), rounded to FLOAT_PRECISION,
+    from candidates added one by one'''
+
+    def __init__(self):
+        self.consensus = []
+        self.best_distance = float("inf") # best = some max value
+        self.min_distance = float("inf") # not rounded
+
+    def add(self, x, d_x_X):
+        self.min_distance = min(self.min_distance, d_x_X)
+        d_x_X = round(d_x_X, FLOAT_PRECISION)
+        if d_x_X == self.best_distance:
+            self.consensus.append(x)
+        elif d_x_X < self.best_distance:
+            self.best_distance = d_x_X
+            self.consensus = [x]
+
+    def result(self):
+        return sorted(self.consensus)  # universe order, regardless of the scan order
+
+
+class RankedConsensus(ConsensusResult):
+    '''k best candidates ordered by d(x,X) (rounded to FLOAT_PRECISION), with
+    their distances, the number of tied optimal elements and the best quality
+    among them'''
+
+    def __init__(self, elements=(), distances=(), ties=0, best_quality=None, exhaustive=True):
+        super(RankedConsensus, self).__init__(elements, exhaustive)
+        self.distances = list(distances)
+        self.ties = ties
+        self.best_quality = best_quality
+
+    @property
+    def optimum(self):
+        '''Optimal elements among the k best candidates'''
+        return [x for x, d in zip(self, self.distances) if d == self.distances[0]]
+
+
+class BoundedConsensusCollector(ConsensusCollector):
+    '''Keeps only k best candidates in a heap instead of all tied ones, counts
+    the optimal elements and takes the best quality(x, d(x,X)) among them
+    during the scan (for n-optimality with n != 1 pass d(x,X) for n = 1)'''
+
+    def __init__(self, k=1, quality=None):
+        super(BoundedConsensusCollector, self).__init__()
+        self.k = k
+        self.quality = quality
+        self.heap = []  # (-distance, negated x) - the worst candidate on top
+        self.ties = 0
+        self.best_quality = None
+
+    def add(self, x, d_x_X, d1_x_X=None):
+        self.min_distance = min(self.min_distance, d_x_X)
+        if d1_x_X is None:
+            d1_x_X = d_x_X
+        d_x_X = round(d_x_X, FLOAT_PRECISION)
+        if d_x_X < self.best_distance:
+            self.best_distance = d_x_X
+            self.ties = 0
+            self.best_quality = None
+        if d_x_X == self.best_distance:
+            self.ties += 1
+            if self.quality is not None:
+                q = self.quality(x, d1_x_X)
+                self.best_quality = q if self.best_quality is None else max(self.best_quality, q)
+        # ties of the k-th candidate are resolved in universe order
+        item = (-d_x_X, tuple(-v for v in x))
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def result(self, exhaustive=True):
+        ranked = sorted((-d, tuple(-v for v in x)) for d, x in self.heap)
+        return RankedConsensus([x for _, x in ranked], [d for d, _ in ranked], self.ties,
+            self.best_quality, exhaustive)
+
+
 class ConsensusAlgorithm(object):
+    # bump when results of the algorithm change (cached runs are recomputed)
+    version = 1
 
     @classmethod
-    def run(cls, profile):
+    def run(cls, profile, control=None):
+        '''Returns list of consensus elements. Search is bounded by control
+        (SearchControl) - if it stops the search, ConsensusResult with the
+        best elements found so far and exhaustive = False is returned.'''
         raise NotImplementedError()
 
 
 class NOptimalityAlgorithm(ConsensusAlgorithm):
 
     @classmethod
-    def _run(cls, profile, n):
-        consensus = []
-        best_distance = float("inf") # best = some max value
-        universe = profile.get_universe()
-        for x in progress.bar(universe, hide=profile.hide_progress):
-            d_x_X = round(profile.sum_of_distances_for_element(x, n), FLOAT_PRECISION)
-            if d_x_X == best_distance:
-                consensus.append(x)
-            elif d_x_X < best_distance:
-                best_distance = d_x_X
-                consensus = [x]
-        return consensus
+    def _run(cls, profile, n, control=None):
+        control = control or default_control(profile)
+        return cls._select(profile.universe_sums(n), control, profile.universe_size())
+
+    @classmethod
+    def run_top(cls, profile, k=1, control=None):
+        '''Returns RankedConsensus - k best elements of universe, the number
+        of optimal ones and their best quality, in memory bounded by k'''
+        collector = BoundedConsensusCollector(k, profile.quality_for_sum)
+        powers = (cls.n,) if cls.n == 1 else (cls.n, 1)
+        def add((x, sums)):
+            collector.add(x, *sums)
+        control = control or default_control(profile)
+        exhaustive = control.run(profile.universe_power_sums(powers), add, profile.universe_size())
+        return collector.result(exhaustive)
+
+    @classmethod
+    def _select(cls, sums, control=None, total=None):
+        '''Returns elements x with minimal d(x,X) (rounded to FLOAT_PRECISION)
+        from pairs (x, d(x,X))'''
+        collector = ConsensusCollector()
+        if control is None:
+            for x, d_x_X in sums:
+                collector.add(x, d_x_X)
+            return ConsensusResult(collector.result())
+        exhaustive = control.run(sums, lambda (x, d_x_X): collector.add(x, d_x_X), total)
+        return ConsensusResult(collector.result(), exhaustive)
 
 
 class ConsensusO1(NOptimalityAlgorithm):
     name = 'ConsensusO1'
+    n = 1
+
+    @classmethod
+    def run(cls, profile, control=None):
+        if hasattr(profile, 'get_column_counts'):
+            return cls._run_binary(profile)
+        return cls._run(profile, 1, control)
+
+    @classmethod
+    def _run_binary(cls, profile):
+        '''For manhattan distance on binary vectors the 1-optimal elements take
+        the majority value in every column and both values in tied columns'''
+        ones = profile.get_column_counts()
+        zeros = len(profile.get_array()) - ones
+        choices = []
+        for o, z in zip(ones, zeros):
+            if o > z:
+                choices.append((1,))
+            elif o < z:
+                choices.append((0,))
+            else:
+                choices.append((0, 1))
+        return ConsensusSet(choices)
+
+    @classmethod
+    def run_top(cls, profile, k=1, control=None):
+        if hasattr(profile, 'get_column_counts'):
+            return cls._run_top_binary(profile, k)
+        return super(ConsensusO1, cls).run_top(profile, k, control)
+
+    @staticmethod
+    def _flip_subsets(costs):
+        '''Yields (sum, indexes) of all subsets of costs sorted ascending, in
+        nondecreasing order of the sum - every subset is reached from its
+        predecessor by appending the next index or moving the last one'''
+        yield 0, ()
+        if not costs:
+            return
+        heap = [(costs[0], (0,))]
+        while heap:
+            total, indexes = heapq.heappop(heap)
+            yield total, indexes
+            last = indexes[-1]
+            if last + 1 < len(costs):
+                heapq.heappush(heap, (total + costs[last + 1], indexes + (last + 1,)))
+                heapq.heappush(heap, (total - costs[last] + costs[last + 1], indexes[:-1] + (last + 1,)))
 
     @classmethod
-    def run(cls, profile):
-        return cls._run(profile, 1)
+    def _run_top_binary(cls, profile, k):
+        '''k best elements in closed form. Flipping the majority value of
+        column j adds |2 c_j - m| to the sum of mismatches, tied columns are
+        free, so candidates come in groups of flipped columns ordered by cost.
+        Groups are taken until k candidates are found and the distance of the
+        last one changes, then merged in universe order.'''
+        ones = profile.get_column_counts()
+        m = len(profile.get_array())
+        majority = [1 if 2 * o > m else 0 for o in ones]
+        columns = sorted((abs(2 * int(o) - m), j) for j, o in enumerate(ones) if 2 * o != m)
+        costs = [cost for cost, _ in columns]
+        base = int(numpy.minimum(ones, m - ones).sum())
+        tied = sum(1 for o in ones if 2 * o == m)
+
+        groups, found, ties, last = [], 0, 0, None
+        best_distance = round(float(base) / profile.length, FLOAT_PRECISION)
+        for total, indexes in cls._flip_subsets(costs):
+            d_x_X = round(float(base + total) / profile.length, FLOAT_PRECISION)
+            if found >= k and d_x_X != last:
+                break
+            choices = [(0, 1) if 2 * o == m else (v,) for o, v in zip(ones, majority)]
+            for i in indexes:
+                j = columns[i][1]
+                choices[j] = (1 - majority[j],)
+            groups.append(izip(repeat(d_x_X), ConsensusSet(choices)))
+            found += 2 ** tied
+            if d_x_X == best_distance:
+                ties += 2 ** tied
+            last = d_x_X
+
+        ranked = list(islice(heapq.merge(*groups), k))
+        best = ranked[0][1]
+        return RankedConsensus([x for _, x in ranked], [d for d, _ in ranked], ties,
+            profile.quality_for_sum(best, float(base) / profile.length))
 
 
 class ConsensusO2(NOptimalityAlgorithm):
     name = 'ConsensusO2'
+    n = 2
+
+    @classmethod
+    def run(cls, profile, control=None):
+        return cls._run(profile, 2, control)
+
+
+class ConsensusO2BranchAndBound(ConsensusO2):
+    '''Exact ConsensusO2 for binary profiles without enumerating the universe.
+
+    Bits are assigned depth-first, starting from the most decisive columns.
+    With partial distances a_j and b_j mismatches still to come in the
+    remaining columns, sum w_j (a_j + b_j)^2 is bounded from below by
+    - sum w_j a_j^2 + sum w_j (2 a_j + 1) b_j, as b^2 >= b for integer b,
+    - sum w_j a_j^2 + 2 sum w_j a_j b_j + (sum w_j b_j)^2 / sum w_j (Jensen),
+    where sums linear in b_j are minimized independently per column.
+    Subtrees whose bound exceeds the best sum found so far are pruned. The
+    search starts from a locally optimal column majority, which is usually
+    close to the optimum.'''
+    name = 'ConsensusO2BnB'
+
+    @classmethod
+    def _local_search(cls, bits, weights, x):
+        '''Flips single bits of x as long as the sum of squares decreases'''
+        signs = 1 - 2 * bits
+        total = weights.sum()
+        while True:
+            partial = numpy.abs(bits - x).sum(1)
+            # change of sum of squares after flipping every single bit
+            deltas = (2 * weights * partial).dot(signs * (1 - 2 * x)) + total
+            col = deltas.argmin()
+            if deltas[col] >= 0:
+                return x
+            x[col] ^= 1
+
+    @classmethod
+    def _search(cls, profile, add, limit, control):
+        '''Depth-first search over bits of candidates. Leaves whose lower bound
+        does not exceed limit(best) are passed to add(x, d(x,X), d1(x,X)) -
+        best is the sum of the local optimum. Returns (exhaustive, local
+        optimum).'''
+        elements, weights, _ = profile.get_unique()
+        length = profile.length
+        bits = unpack_binary(elements, length).astype(numpy.int64)
+        weights = weights.astype(numpy.int64)
+        total = weights.sum()
+        scale = float(length) ** 2
+
+        counts = bits.T.dot(weights)
+        order = numpy.argsort(-numpy.abs(2 * counts - total), kind='mergesort')
+        bits = bits[:, order]
+        counts = counts[order]
+
+        majority = (counts * 2 >= total).astype(numpy.int64)
+        local = cls._local_search(bits, weights, majority)
+        best = round(weights.dot(numpy.abs(bits - local).sum(1) ** 2) / scale, FLOAT_PRECISION)
+        nodes = [0]
+
+        def unsorted(assignment):
+            x = [0] * length
+            for col, value in zip(order, assignment):
+                x[col] = value
+            return tuple(x)
+
+        def search():
+            # depth-first, with explicit stack of (depth, partial distances, bit
+            # at depth - 1) - vectors may be longer than the recursion limit
+            assignment = []
+            stack = [(0, numpy.zeros(len(bits), dtype=numpy.int64), None)]
+            while stack:
+                depth, partial, value = stack.pop()
+                del assignment[max(depth - 1, 0):]
+                if depth:
+                    assignment.append(value)
+                nodes[0] += 1
+                if not control.step(nodes[0]):
+                    raise SearchStopped()
+                squares = weights.dot(partial ** 2)
+                if depth == length:
+                    if round(squares / scale, FLOAT_PRECISION) <= limit(best):
+                        add(unsorted(assignment), squares / scale, weights.dot(partial) / float(length))
+                    continue
+                weighted = weights * partial
+                cost_a_0 = weighted.dot(bits[:, depth:])
+                cost_a_1 = weighted.sum() - cost_a_0
+                cost_w_0 = counts[depth:]
+                cost_w_1 = total - cost_w_0
+                cost_0 = 2 * cost_a_0 + cost_w_0
+                cost_1 = 2 * cost_a_1 + cost_w_1
+                bound = squares + max(
+                    numpy.minimum(cost_0, cost_1).sum(),
+                    2 * numpy.minimum(cost_a_0, cost_a_1).sum() +
+                        numpy.minimum(cost_w_0, cost_w_1).sum() ** 2 / float(total))
+                if round(bound / scale, FLOAT_PRECISION) > limit(best):
+                    continue
+                # the cheaper bit is searched first, so it is pushed last
+                for bit in ((1, 0) if cost_0[0] <= cost_1[0] else (0, 1)):
+                    stack.append((depth + 1, partial + (bits[:, depth] != bit), bit))
+
+        control.start()
+        exhaustive = True
+        try:
+            search()
+        except SearchStopped:
+            exhaustive = False
+        except KeyboardInterrupt:
+            if not control.interruptible:
+                raise
+            exhaustive = False
+        finally:
+            control.finish(nodes[0])
+        return exhaustive, unsorted(local.tolist())
 
     @classmethod
-    def run(cls, profile):
-        return cls._run(profile, 2)
+    def run(cls, profile, control=None):
+        if not hasattr(profile, 'get_column_counts'):
+            return super(ConsensusO2BranchAndBound, cls).run(profile, control)
+        collector = ConsensusCollector()
+        exhaustive, local = cls._search(profile, lambda x, d_x_X, d1_x_X: collector.add(x, d_x_X),
+            lambda best: min(best, collector.best_distance), control or default_control(profile))
+        if not exhaustive and local not in collector.consensus:
+            # stopped before reaching all leaves as good as the local optimum
+            collector.add(local, profile.sum_of_distances_for_element(local, cls.n))
+        return ConsensusResult(collector.result(), exhaustive)
+
+    @classmethod
+    def run_top(cls, profile, k=1, control=None):
+        '''k best candidates found by the same search - subtrees which cannot
+        contain a leaf better than the k-th best one found so far are pruned'''
+        if not hasattr(profile, 'get_column_counts'):
+            return super(ConsensusO2BranchAndBound, cls).run_top(profile, k, control)
+        collector = BoundedConsensusCollector(k, profile.quality_for_sum)
+
+        def limit(best):
+            if len(collector.heap) == k:
+                return -collector.heap[0][0]
+            # the local optimum bounds only the best leaf
+            return best if k == 1 else float('inf')
+
+        exhaustive, local = cls._search(profile, collector.add, limit, control or default_control(profile))
+        if not exhaustive and local not in collector.result():
+            collector.add(local, profile.sum_of_distances_for_element(local, cls.n),
+                profile.sum_of_distances_for_element(local))
+        return collector.result(exhaustive)
 
 
 class OptimalAlgorithm(ConsensusAlgorithm):
     name = 'OptimalAlgorithm'
 
     @classmethod
-    def run(cls, profile):
-        consensus = []
-        for i in progress.bar(range(profile.length), hide=profile.hide_progress):
-            col = map(lambda member: member[i], profile.elements)
-            consensus.append(int(col.count(1) >= col.count(0)))
+    def run(cls, profile, control=None):
+        elements = numpy.array(profile.elements)
+        ones = (elements == 1).sum(0)
+        zeros = (elements == 0).sum(0)
+        consensus = (ones >= zeros).astype(int).tolist()
         return [consensus]  # result in list for compatibility with other algorithms
 
+    @classmethod
+    def run_batch(cls, batch):
+        '''Consensus for every profile of BinaryProfileBatch - (count, length) array'''
+        ones = batch.get_column_counts()
+        return (ones >= batch.n - ones).astype(int)
+
 
 CONSENSUS_ALGORITHMS = {
     ConsensusO1.name: ConsensusO1,
     ConsensusO2.name: ConsensusO2,
+    ConsensusO2BranchAndBound.name: ConsensusO2BranchAndBound,
     OptimalAlgorithm.name: OptimalAlgorithm
 }
+
+# ConsensusO2BnB finds the same consensus as ConsensusO2, so it is run only
+# on request
+DEFAULT_ALGORITHMS = [ConsensusO1.name, ConsensusO2.name, OptimalAlgorithm.name]
@@ -1,63 +1,422 @@
 # coding: utf-8
 
-import random
+import sys
 import time
-from itertools import product
+from math import sqrt
+from itertools import product, count
+from collections import OrderedDict
 
+import numpy
 from numpy import matrix
 from clint.textui import progress
 
-from consfinder.functions import manhattan_dist, euclidean_distance
+from consfinder.functions import (manhattan_dist, hamming_dist_matrix, hamming_pair_dist, pack_binary,
+    unpack_binary, unique_rows, POPCOUNT_TABLE, ConsensusCollector, BoundedConsensusCollector, ConsensusResult,
+    ConsensusO1, ConsensusO2, default_control)
+from consfinder.utils import derive_seeds
+
+
+MATRIX_BLOCK_SIZE = 1000
+UNIVERSE_CHUNK_SIZE = 4096
+SAMPLE_BATCH_SIZE = 10000
+MAX_SAMPLE_SIZE = 10 ** 7
 
 
 class NoUniverse(Exception):
     pass
 
 
+class BinaryUniverse(object):
+    '''Lazy universe of all binary vectors of given length. Element i is the
+    bit pattern of i (most significant bit first), which is the order of
+    product([0, 1], repeat=length). size is the number of vectors, len() works
+    only for universes smaller than sys.maxsize.'''
+
+    def __init__(self, length):
+        self.length = length
+        self.size = 2 ** length
+
+    def __len__(self):
+        if self.size > sys.maxsize:
+            raise OverflowError('Universe of %s-bit vectors is too large for len(), use size' % self.length)
+        return self.size
+
+    def __nonzero__(self):
+        return True
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('universe index out of range')
+        return tuple((index >> shift) & 1 for shift in xrange(self.length - 1, -1, -1))
+
+    def __iter__(self):
+        return product([0, 1], repeat=self.length)
+
+    def chunks(self, size=UNIVERSE_CHUNK_SIZE):
+        '''Yields consecutive parts of universe as 2-D arrays of bits'''
+        shifts = numpy.arange(self.length - 1, -1, -1)
+        start = 0
+        while start < self.size:
+            stop = min(start + size, self.size)
+            if self.length < 63:
+                indices = numpy.arange(start, stop)
+                yield ((indices[:, numpy.newaxis] >> shifts) & 1).astype(numpy.uint8)
+            else:
+                # indices do not fit in int64
+                yield numpy.array([self[i] for i in range(start, stop)], dtype=numpy.uint8)
+            start = stop
+
+
+_binary_universes = {}
+
+def get_binary_universe(length):
+    '''Returns BinaryUniverse shared by all profiles of given length'''
+    if length not in _binary_universes:
+        _binary_universes[length] = BinaryUniverse(length)
+    return _binary_universes[length]
+
+
+def _row_offset(i):
+    '''Position of the first entry of row i in condensed matrix'''
+    return i * (i - 1) // 2
+
+
+def iter_binary_vectors(lines):
+    '''Yields binary vectors from lines of comma separated bits, skipping
+    empty lines and comments (lines starting with #)'''
+    for line in lines:
+        if not line.startswith('#') and line.strip():
+            yield [int(x) for x in line.strip().split(',')]
+
+
 class Profile(object):
 
-    def __init__(self, n, length, distance_func, hide_progress=True, **kwargs):
+    def __init__(self, n, length, distance_func, distance_matrix_func=None, hide_progress=True,
+            matrix_file=None, matrix_dtype=numpy.float64, **kwargs):
+        '''With matrix_file the matrix of distances is computed in row blocks
+        straight into memory-mapped file, holding values of matrix_dtype.
+        Integer dtypes store exact raw distances (e.g. hamming counts), if
+        profile can provide them.'''
         self.n = n
         self.length = length
         self.distance_func = distance_func
+        self.distance_matrix_func = distance_matrix_func
         self.hide_progress = hide_progress
+        self.matrix_file = matrix_file
+        self.matrix_dtype = numpy.dtype(matrix_dtype)
         self.init_empty()
 
     def init_empty(self):
         self.universe = []
+        self.array = None
         self.elements = []
+        self.clear_cache()
+
+    def clear_cache(self):
+        '''Drops everything computed from profile elements'''
+        self.unique = None
+        self.unique_positions = None
+        self.condensed_matrix = None
+        self.row_sums = None
+        self.diameter = None
+        self.matrix_scale = 1.0
         self.matrix = None
         self.vector = []
 
     def get_universe(self):
-        if not self.universe:
+        if self.universe is None or not len(self.universe):
             raise NoUniverse()
         return self.universe
 
-    def get_matrix(self):
-        '''Returns the matrix of distances between profile elements'''
-        if self.matrix is None:
+    def as_array(self, elements):
+        '''Converts a collection of elements to the array representation
+        accepted by distances()'''
+        return numpy.array(elements)
+
+    def get_array(self):
+        '''Returns profile elements as 2-D array (one element per row)'''
+        if self.array is None:
+            if not len(self.elements):
+                return numpy.zeros((0, self.length))
+            self.array = self.as_array(self.elements)
+        return self.array
+
+    def get_unique(self):
+        '''Returns profile as a weighted multiset - a tuple of (distinct elements,
+        their multiplicities, indices of distinct element for every profile element)'''
+        if self.unique is None:
+            self.unique = unique_rows(self.get_array())
+        return self.unique
+
+    def distances(self, elements_x, elements_y):
+        '''Returns the matrix of distances between every element of elements_x
+        and every element of elements_y'''
+        if self.distance_matrix_func is not None:
+            return self.distance_matrix_func(elements_x, elements_y)
+        return numpy.array([[self.distance_func(x, y) for y in elements_y]
+            for x in elements_x], dtype=float).reshape(len(elements_x), len(elements_y))
+
+    def raw_distances(self, elements_x, elements_y):
+        '''Returns a tuple (distances multiplied by scale, scale) - profiles
+        with exact integer distances return them here'''
+        return self.distances(elements_x, elements_y), 1.0
+
+    def pair_distances(self, elements_x, elements_y):
+        '''Returns distances between corresponding elements of elements_x and elements_y'''
+        return numpy.array([self.distance_func(x, y) for x, y in zip(elements_x, elements_y)], dtype=float)
+
+    def _block_rows(self, m):
+        '''Number of rows of m x m matrix processed at once'''
+        return max(1, MATRIX_BLOCK_SIZE ** 2 // max(1, m))
+
+    def _matrix_values(self, elements_x, elements_y):
+        '''Distances in the form stored in condensed matrix (see matrix_dtype)'''
+        if not numpy.issubdtype(self.matrix_dtype, numpy.integer):
+            return self.distances(elements_x, elements_y)
+        values, self.matrix_scale = self.raw_distances(elements_x, elements_y)
+        if not numpy.issubdtype(values.dtype, numpy.integer):
+            raise ValueError('Profile has no integer distances to store as %s' % self.matrix_dtype)
+        if self.matrix_scale > numpy.iinfo(self.matrix_dtype).max:
+            raise ValueError('Distances of profile do not fit in %s' % self.matrix_dtype)
+        return values
+
+    def get_condensed_matrix(self):
+        '''Returns the matrix of distances between distinct profile elements in
+        condensed form - lower triangle without diagonal, row after row (row i
+        holds distances to elements j < i, so rows of new elements are simply
+        appended), stored as matrix_dtype values multiplied by matrix_scale'''
+        if self.condensed_matrix is None:
             t = time.time()
-            matrix_ = []
-            for i in progress.bar(self.elements, hide=self.hide_progress):
-                matrix_.append([self.distance_func(i, j) for j in self.elements])
-            self.matrix = matrix(matrix_)
+            elements = self.get_unique()[0]
+            m = len(elements)
+            size = _row_offset(m)
+            if self.matrix_file:
+                condensed = numpy.memmap(self.matrix_file, dtype=self.matrix_dtype, mode='w+',
+                    shape=(max(1, size),))[:size]
+            else:
+                condensed = numpy.empty(size, dtype=self.matrix_dtype)
+            rows = self._block_rows(m)
+            blocks = range(0, m, rows)
+            for start in progress.bar(blocks, hide=self.hide_progress or len(blocks) < 2):
+                stop = min(m, start + rows)
+                # distances to elements j < stop, upper triangle of the block is skipped
+                block = self._matrix_values(elements[start:stop], elements[:stop])
+                for i in xrange(start, stop):
+                    condensed[_row_offset(i):_row_offset(i + 1)] = block[i - start, :i]
+            if self.matrix_file:
+                condensed.flush()
+            self.condensed_matrix = condensed
             if not self.hide_progress:
                 print "Matrix of distances generated in %s secs" % (int(time.time() - t))
+        return self.condensed_matrix
+
+    def iter_condensed_rows(self):
+        '''Yields pairs (i, distances between distinct elements i and j < i)'''
+        condensed = self.get_condensed_matrix()
+        m = len(self.get_unique()[0])
+        rows = self._block_rows(m)
+        for start in xrange(0, m, rows):
+            stop = min(m, start + rows)
+            block = condensed[_row_offset(start):_row_offset(stop)].astype(float) / self.matrix_scale
+            for i in xrange(start, stop):
+                yield i, block[_row_offset(i) - _row_offset(start):_row_offset(i + 1) - _row_offset(start)]
+
+    def get_matrix(self):
+        '''Returns the matrix of distances between profile elements (square
+        form, built on demand from the condensed matrix)'''
+        if self.matrix is None:
+            inverse = self.get_unique()[2]
+            m = len(self.get_unique()[0])
+            square = numpy.zeros((m, m))
+            for i, row in self.iter_condensed_rows():
+                square[i, :i] = row
+                square[:i, i] = row
+            self.matrix = matrix(square[inverse][:, inverse])
         return self.matrix
 
+    def _unique_row_sums(self):
+        '''Sums of distances between every distinct element and all profile elements'''
+        if self.row_sums is None:
+            weights = self.get_unique()[1]
+            sums = numpy.zeros(len(weights))
+            for i, row in self.iter_condensed_rows():
+                sums[i] += row.dot(weights[:i])
+                sums[:i] += row * weights[i]
+            self.row_sums = sums
+        return self.row_sums
+
+    def _sum_of_distances(self):
+        '''Sum of distances between all ordered pairs of profile elements'''
+        weights = self.get_unique()[1]
+        return float(weights.dot(self._unique_row_sums()))
+
     def get_vector(self):
         if self.vector:
             return self.vector
         else:
-            m = self.get_matrix()
-            avg_in_column = lambda m, i: m.sum(0).item(i) / float(len(m)-1)
-            self.vector = [avg_in_column(m, i) for i in range(len(m))]
+            inverse = self.get_unique()[2]
+            sums = self._unique_row_sums()
+            self.vector = (sums[inverse] / float(len(inverse) - 1)).tolist()
             return self.vector
 
     def profile_diameter(self):
         '''Diameter of profile - max value in matrix of distances'''
-        return self.get_matrix().max()
+        if self.diameter is None:
+            condensed = self.get_condensed_matrix()
+            weights = self.get_unique()[1]
+            present = weights > 0
+            result = 0
+            if present.all():
+                step = MATRIX_BLOCK_SIZE ** 2
+                size = _row_offset(len(weights))
+                for start in xrange(0, size, step):
+                    result = max(result, condensed[start:min(size, start + step)].max())
+                result = result / self.matrix_scale
+            else:
+                # distinct elements removed from profile are kept with weight 0
+                for i, row in self.iter_condensed_rows():
+                    if present[i] and present[:i].any():
+                        result = max(result, row[present[:i]].max())
+            self.diameter = result
+        return self.diameter
+
+    def _unique_position(self, packed_x):
+        '''Index of distinct element equal to packed_x (None if there is none)'''
+        if self.unique_positions is None:
+            elements = self.get_unique()[0]
+            self.unique_positions = dict((e.tostring(), i) for i, e in enumerate(elements))
+        return self.unique_positions.get(packed_x.tostring())
+
+    def _distances_to_unique(self, k):
+        '''Distances between distinct element k and all distinct elements'''
+        elements = self.get_unique()[0]
+        if self.condensed_matrix is None:
+            return self.distances(elements[k:k + 1], elements)[0]
+        condensed = self.condensed_matrix
+        distances = numpy.zeros(len(elements))
+        distances[:k] = condensed[_row_offset(k):_row_offset(k + 1)]
+        columns = numpy.arange(k + 1, len(elements))
+        distances[k + 1:] = condensed[columns * (columns - 1) // 2 + k]
+        return distances / self.matrix_scale
+
+    def _add_unique(self, packed_x):
+        '''Appends new distinct element with multiplicity 0, returns its index'''
+        elements, weights, inverse = self.get_unique()
+        k = len(elements)
+        if self.condensed_matrix is not None and self.matrix_file:
+            self.condensed_matrix = None
+            self.row_sums = None
+            self.diameter = None
+        elif self.condensed_matrix is not None:
+            # rows are appended to a buffer growing twice at a time
+            condensed = self.condensed_matrix
+            buffer = condensed if condensed.base is None else condensed.base
+            size = _row_offset(k + 1)
+            if len(buffer) < size:
+                buffer = numpy.empty(max(size, 2 * len(buffer)), dtype=condensed.dtype)
+                buffer[:len(condensed)] = condensed
+            buffer[_row_offset(k):size] = self._matrix_values(packed_x, elements)[0]
+            self.condensed_matrix = buffer[:size]
+        if self.row_sums is not None:
+            self.row_sums = numpy.append(self.row_sums,
+                self.distances(packed_x, elements)[0].dot(weights))
+        self.unique = (numpy.vstack([elements, packed_x]), numpy.append(weights, 0), inverse)
+        self.unique_positions[packed_x[0].tostring()] = k
+        return k
+
+    def _update_weight(self, k, delta):
+        '''Changes multiplicity of distinct element k by delta (1 or -1),
+        computed sums of distances and diameter are updated in O(n)'''
+        weights = self.get_unique()[1]
+        distances = None
+        if self.row_sums is not None:
+            distances = self._distances_to_unique(k)
+            self.row_sums += delta * distances
+        weights[k] += delta
+        if self.diameter is not None and weights[k] == (1 if delta > 0 else 0):
+            if delta > 0 and self.condensed_matrix is not None:
+                if distances is None:
+                    distances = self._distances_to_unique(k)
+                others = weights > 0
+                others[k] = False
+                if others.any():
+                    self.diameter = max(self.diameter, distances[others].max())
+            else:
+                self.diameter = None
+        self.vector = []
+        self.matrix = None
+
+    def _element(self, i):
+        '''Returns i-th element of profile'''
+        return self.elements[i]
+
+    def _set_element(self, i, x):
+        '''Keeps list of elements in line with array - x is put at position i
+        (appended for i == len(elements), i-th element is removed for None)'''
+        if x is None:
+            del self.elements[i]
+        elif i == len(self.elements):
+            self.elements.append(x)
+        else:
+            self.elements[i] = x
+
+    def add_element(self, x):
+        '''Appends x to profile. Distances are computed only between x and
+        distinct elements, computed measures are updated in O(n).'''
+        packed_x = self.as_array([x])
+        k = self._unique_position(packed_x[0])
+        if k is None:
+            k = self._add_unique(packed_x)
+        self._update_weight(k, 1)
+        elements, weights, inverse = self.unique
+        self.unique = (elements, weights, numpy.append(inverse, k))
+        array = self.get_array()
+        self.array = numpy.vstack([array, packed_x])
+        self._set_element(len(array), x)
+        self.n = len(self.array)
+
+    def remove_element(self, i):
+        '''Removes i-th element from profile and returns it. Distinct element
+        which no longer occurs in profile is kept with multiplicity 0.'''
+        x = self._element(i)
+        elements, weights, inverse = self.get_unique()
+        self._update_weight(inverse[i], -1)
+        self.unique = (elements, weights, numpy.delete(inverse, i))
+        self.array = numpy.delete(self.get_array(), i, axis=0)
+        self._set_element(i, None)
+        self.n = len(self.array)
+        return x
+
+    def replace_element(self, i, x):
+        '''Replaces i-th element of profile with x (e.g. an agent changed its
+        opinion) in O(n), returns the replaced element'''
+        old_x = self._element(i)
+        packed_x = self.as_array([x])
+        k = self._unique_position(packed_x[0])
+        if k is None:
+            k = self._add_unique(packed_x)
+        inverse = self.get_unique()[2]
+        self._update_weight(inverse[i], -1)
+        self._update_weight(k, 1)
+        inverse[i] = k
+        self.get_array()[i] = packed_x[0]
+        self._set_element(i, x)
+        return old_x
+
+    def compact(self):
+        '''Drops distinct elements with multiplicity 0 left after removals'''
+        elements, weights, inverse = self.get_unique()
+        present = weights > 0
+        if present.all():
+            return
+        positions = numpy.cumsum(present) - 1
+        self.unique = (elements[present], weights[present], positions[inverse])
+        self.unique_positions = None
+        self.condensed_matrix = None
+        if self.row_sums is not None:
+            self.row_sums = self.row_sums[present]
 
     def vector_diameter(self):
         '''Diameter of vector of average distances - max value in vector'''
@@ -65,37 +424,62 @@ class Profile(object):
 
     def d_mean(self):
         '''The average distance in profile'''
-        m = len(self.get_matrix())
-        total = 0.0
-        for i in xrange(m):
-            for j in xrange(m):
-                total += self.get_matrix()[i].item(j)
-        result = total / (m * (m - 1))
-        return result
+        m = len(self.get_array())
+        return self._sum_of_distances() / (m * (m - 1))
 
     def d_t_mean(self):
         '''The total average distance in profile'''
-        m = len(self.elements)
-        total = 0.0
-        for x in self.elements:
-            for y in self.elements:
-                total += self.distance_func(x, y)
-        result = total / (m * (m + 1))
-        return result
+        m = len(self.get_array())
+        return self._sum_of_distances() / (m * (m + 1))
 
     def sum_of_distances_for_element(self, x, n=1):
         '''d(x,X) - returns the sum of distances between an element x of universe U
         and the elements of profile.'''
-        return sum([pow(self.distance_func(x,y), n) for y in self.elements])
+        elements, weights, _ = self.get_unique()
+        return float((self.distances(self.as_array([x]), elements)[0] ** n).dot(weights))
+
+    def universe_size(self):
+        return len(self.get_universe())
+
+    def iter_universe_chunks(self):
+        '''Yields consecutive parts of the universe converted with as_array()'''
+        universe = self.get_universe()
+        for start in xrange(0, len(universe), UNIVERSE_CHUNK_SIZE):
+            yield self.as_array(universe[start:start + UNIVERSE_CHUNK_SIZE])
+
+    def universe_sums(self, n=1):
+        '''Yields pairs (x, d(x,X)) for every element x of universe U, where
+        d(x,X) is the sum of n-powers of distances to profile elements'''
+        for x, sums in self.universe_power_sums((n,)):
+            yield x, sums[0]
+
+    def universe_power_sums(self, powers):
+        '''Like universe_sums, but yields pairs (x, list of d(x,X) for every
+        power n in powers) - the universe is scanned once for all powers'''
+        universe = self.get_universe()
+        elements, weights, _ = self.get_unique()
+        start = 0
+        for chunk in self.iter_universe_chunks():
+            distances = self.distances(chunk, elements)
+            sums = numpy.column_stack([(distances ** n).dot(weights) for n in powers])
+            xs = universe[start:start + len(chunk)]
+            if isinstance(xs, numpy.ndarray):
+                xs = [tuple(x) for x in xs.tolist()]
+            for x, d_x_X in zip(xs, sums.tolist()):
+                yield x, d_x_X
+            start += len(chunk)
 
     def sums_profile_to_universe(self):
         '''Returns set of all sums of distances between profile elements 
         and elements from the universe'''
-        return set([self.sum_of_distances_for_element(x)
-            for x in self.get_universe()])
+        elements, weights, _ = self.get_unique()
+        sums = set()
+        for chunk in self.iter_universe_chunks():
+            sums.update(self.distances(chunk, elements).dot(weights).tolist())
+        return sums
 
     def minimal_avg_distance(self):
-        return (1.0/len(self.elements)) * min(self.sums_profile_to_universe())
+        return (1.0/len(self.get_array())) * min(self.sums_profile_to_universe())
 
     def c1(self):
         return 1 - self.profile_diameter()
@@ -113,7 +497,11 @@ class Profile(object):
         return 1 - self.minimal_avg_distance()
 
     def quality(self, x):
-        return 1 - self.sum_of_distances_for_element(x) / len(self.elements)
+        return 1 - self.sum_of_distances_for_element(x) / len(self.get_array())
+
+    def quality_for_sum(self, x, d_x_X):
+        '''Quality of x with already known d(x,X) (sum of distances, n = 1)'''
+        return 1 - d_x_X / len(self.get_array())
 
     def load(self, *args, **kwargs):
         raise NotImplementedError()
@@ -126,33 +514,501 @@ class Profile(object):
 
 
 class BinaryProfile(Profile):
+    '''Profile of binary vectors. Elements are stored packed in rows of uint8
+    words, distances are computed with XOR + popcount.'''
 
     def __init__(self, n, length, **kwargs):
         super(BinaryProfile, self).__init__(n, length, distance_func=manhattan_dist, **kwargs)
 
-    def _init_universe(self):
-        t = time.time()
-        self.universe = [x for x in product([0,1], repeat=self.length)]
-        if not self.hide_progress:
-            print "Space of %s vectors have been generated in %s secs" % (len(self.universe), (int(time.time() - t)))
+    @property
+    def elements(self):
+        '''Profile elements unpacked to lists of bits'''
+        if self.array is None:
+            return []
+        return unpack_binary(self.array, self.length).tolist()
+
+    @elements.setter
+    def elements(self, elements):
+        self.array = self.as_array(elements) if len(elements) else None
+
+    def as_array(self, elements):
+        return pack_binary(elements)
+
+    def get_array(self):
+        if self.array is None:
+            return pack_binary(numpy.zeros((0, self.length)))
+        return self.array
+
+    def distances(self, elements_x, elements_y):
+        return hamming_dist_matrix(elements_x, elements_y) / float(self.length)
+
+    def raw_distances(self, elements_x, elements_y):
+        return hamming_dist_matrix(elements_x, elements_y), float(self.length)
+
+    def pair_distances(self, elements_x, elements_y):
+        return hamming_pair_dist(elements_x, elements_y) / float(self.length)
+
+    def clear_cache(self):
+        super(BinaryProfile, self).clear_cache()
+        self.column_counts = None
+
+    def get_column_counts(self):
+        '''Number of ones in every column of profile'''
+        if self.column_counts is None:
+            elements, weights, _ = self.get_unique()
+            self.column_counts = weights.dot(unpack_binary(elements, self.length))
+        return self.column_counts
+
+    def _update_weight(self, k, delta):
+        super(BinaryProfile, self)._update_weight(k, delta)
+        if self.column_counts is not None:
+            self.column_counts += delta * unpack_binary(self.get_unique()[0][k:k + 1], self.length)[0]
+
+    def _element(self, i):
+        return unpack_binary(self.array[i:i + 1], self.length)[0].tolist()
+
+    def _set_element(self, i, x):
+        pass  # elements are unpacked from array
+
+    def _distance_sums_for_unique(self):
+        '''Sums of hamming distances between every distinct element and all
+        profile elements, derived from column counts without distance matrix'''
+        elements = unpack_binary(self.get_unique()[0], self.length).astype(numpy.int64)
+        counts = self.get_column_counts()
+        m = len(self.get_array())
+        return counts.sum() + elements.dot(m - 2 * counts)
+
+    def _sum_of_distances(self):
+        counts = self.get_column_counts()
+        m = len(self.get_array())
+        return 2 * float(counts.dot(m - counts)) / self.length
 
-    def generate(self, **kwargs):
-        self.init_empty()
-        for i in xrange(self.n):
-            self.elements.append([random.randint(0,1) for _ in xrange(self.length)])
+    def sum_of_distances_for_element(self, x, n=1):
+        if n != 1:
+            return super(BinaryProfile, self).sum_of_distances_for_element(x, n)
+        counts = self.get_column_counts()
+        m = len(self.get_array())
+        return float(counts.sum() + numpy.asarray(x).dot(m - 2 * counts)) / self.length
+
+    def minimal_avg_distance(self):
+        '''Closed form of min d(x,X)/|X| - in every column the minority
+        elements are at distance 1 from the best x'''
+        counts = self.get_column_counts()
+        m = len(self.get_array())
+        return numpy.minimum(counts, m - counts).sum() / float(self.length) / m
+
+    def get_vector(self):
+        if not self.vector:
+            inverse = self.get_unique()[2]
+            sums = self._distance_sums_for_unique() / float(self.length)
+            self.vector = (sums[inverse] / float(len(inverse) - 1)).tolist()
+        return self.vector
+
+    def get_universe(self):
         if not self.universe:
             self._init_universe()
+        return self.universe
+
+    def universe_size(self):
+        return 2 ** self.length
+
+    def universe_power_sums(self, powers):
+        '''Walks the universe in Gray code order - consecutive candidates differ
+        in one bit, so distances to all profile elements are updated in O(n)
+        per step instead of being computed from scratch'''
+        elements, weights, _ = self.get_unique()
+        bits = unpack_binary(elements, self.length).astype(numpy.int64)
+        signs = 1 - 2 * bits  # change of distance when bit flips 0 -> 1
+        scales = [float(self.length) ** n for n in powers]
+        candidate = [0] * self.length
+        distances = bits.sum(1)
+        yield tuple(candidate), [weights.dot(distances ** n) / s for n, s in zip(powers, scales)]
+        size = self.universe_size()
+        # xrange and len() do not accept 2^length for long vectors
+        for i in count(1):
+            if i == size:
+                return
+            col = self.length - (i & -i).bit_length()
+            if candidate[col]:
+                distances -= signs[:, col]
+            else:
+                distances += signs[:, col]
+            candidate[col] ^= 1
+            yield tuple(candidate), [weights.dot(distances ** n) / s for n, s in zip(powers, scales)]
+
+    def _init_universe(self):
+        self.universe = get_binary_universe(self.length)
+
+    def iter_universe_chunks(self):
+        for bits in self.get_universe().chunks():
+            yield pack_binary(bits)
+
+    def generate(self, seed=None, **kwargs):
+        self.init_empty()
+        rng = numpy.random.RandomState(seed) if seed is not None else numpy.random
+        self.array = pack_binary(rng.randint(0, 2, size=(self.n, self.length)))
         return self.elements
 
     def load(self, filename):
         self.init_empty()
         with open(filename) as f:
-            lines = filter(lambda l: not l.startswith('#'), f.readlines())
-            lines = [l.strip() for l in lines]
-            for line in lines:
-                if line:
-                    self.elements.append([int(x) for x in line.split(',')])
-        self.length = len(self.elements[0])
-        self._init_universe()
+            elements = list(iter_binary_vectors(f))
+        self.length = len(elements[0])
+        self.elements = elements
         return self.elements
 
+
+class ProfileStatistics(object):
+    '''Consistency functions of profile computed together with O1/O2
+    consensus. Diameter, the vector of average distances and the sum of all
+    distances come from one pass over the distance matrix, and the universe
+    is scanned once for d(x,X) of both powers - c5 and ConsensusO1 share
+    the sums of distances, ConsensusO2 the sums of their squares. Binary
+    profiles take c5 and ConsensusO1 from column counts instead. The scan is
+    bounded by control (SearchControl), exhaustive is False if it was
+    stopped - c5 and consensus are then the best found so far. With top
+    only the top best candidates of every algorithm are kept (see
+    BoundedConsensusCollector) and consensus holds RankedConsensus.'''
+
+    def __init__(self, profile, functions=['c1', 'c2', 'c3', 'c4', 'c5'], algorithms=[], control=None,
+            top=None):
+        self.profile = profile
+        self.measures = OrderedDict()
+        self.consensus = {}
+        self.exhaustive = True
+        self._compute(functions, algorithms, control, top)
+
+    def _compute(self, functions, algorithms, control, top):
+        profile = self.profile
+        m = len(profile.get_array())
+        if 'c1' in functions:
+            self.measures['c1'] = 1 - profile.profile_diameter()
+        if 'c2' in functions:
+            self.measures['c2'] = 1 - profile.vector_diameter()
+        if 'c3' in functions or 'c4' in functions:
+            total = profile._sum_of_distances()
+            if 'c3' in functions:
+                self.measures['c3'] = 1 - total / (m * (m - 1))
+            if 'c4' in functions:
+                self.measures['c4'] = 1 - total / (m * (m + 1))
+
+        closed_form = hasattr(profile, 'get_column_counts')
+        new_collector = lambda: (ConsensusCollector() if top is None else
+            BoundedConsensusCollector(top, profile.quality_for_sum))
+        collectors = OrderedDict()
+        if not closed_form and ('c5' in functions or ConsensusO1.name in algorithms):
+            collectors[1] = new_collector()
+        if ConsensusO2.name in algorithms:
+            collectors[2] = new_collector()
+        if collectors:
+            powers = collectors.keys()
+            if top is not None and 1 not in powers:
+                powers.append(1)  # qualities come from sums of distances
+            one = powers.index(1) if 1 in powers else None
+            def add((x, d_x_X)):
+                for collector, d in zip(collectors.values(), d_x_X):
+                    if top is None:
+                        collector.add(x, d)
+                    else:
+                        collector.add(x, d, d_x_X[one])
+            control = control or default_control(profile)
+            self.exhaustive = control.run(profile.universe_power_sums(powers), add, profile.universe_size())
+            for n, collector in collectors.iteritems():
+                name = ConsensusO1.name if n == 1 else ConsensusO2.name
+                if top is None:
+                    self.consensus[name] = ConsensusResult(collector.result(), self.exhaustive)
+                else:
+                    self.consensus[name] = collector.result(self.exhaustive)
+
+        if 'c5' in functions:
+            if closed_form:
+                self.measures['c5'] = 1 - profile.minimal_avg_distance()
+            else:
+                self.measures['c5'] = 1 - (1.0 / m) * collectors[1].min_distance
+        if closed_form and ConsensusO1.name in algorithms:
+            if top is None:
+                self.consensus[ConsensusO1.name] = ConsensusO1.run(profile)
+            else:
+                self.consensus[ConsensusO1.name] = ConsensusO1.run_top(profile, top)
+        # keep the order of requested functions
+        self.measures = OrderedDict((f, self.measures[f]) for f in functions)
+
+
+class SampledStatistics(object):
+    '''Estimates of consistency functions c2, c3, c4 of profile computed from
+    random samples of elements instead of all n^2 pairs of them. Sampling
+    stops when both ends of confidence interval are closer than tolerance
+    to the estimate. intervals keep (low, high) bounds for every function.
+
+    c3 and c4 come from the mean distance of random pairs of different
+    profile elements. The average distances of c2 are estimated for all
+    elements from a common sample of reference elements (with confidence
+    split between elements), elements which surely do not have the maximal
+    one are dropped and the sample is doubled for the rest, until they are
+    few enough to be computed exactly. Binary profiles take exact values
+    from column counts, which is cheaper than sampling, and so do c3 and c4
+    of profiles with fewer pairs of elements than one batch of samples.
+
+    c2 and the pairs of c3 and c4 are sampled from separate random streams
+    derived from seed, so estimates do not depend on requested functions.'''
+
+    def __init__(self, profile, functions=['c2', 'c3', 'c4'], tolerance=0.01, confidence=0.95, seed=None):
+        self.profile = profile
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.c2_seed, self.pairs_seed = derive_seeds(seed, 2)
+        self.measures = OrderedDict()
+        self.intervals = OrderedDict()
+        self.samples = OrderedDict()
+        functions = [f for f in functions if f in ['c2', 'c3', 'c4']]
+        if len(profile.get_array()) < 2:
+            raise ValueError('Cannot estimate consistency of profile with less than 2 elements')
+        if hasattr(profile, 'get_column_counts'):
+            for f in functions:
+                self.measures[f] = getattr(profile, f)()
+                self.intervals[f] = (self.measures[f], self.measures[f])
+                self.samples[f] = 0
+            return
+        if 'c2' in functions:
+            self._estimate_c2()
+        if 'c3' in functions or 'c4' in functions:
+            self._estimate_c3_c4(functions)
+        self.measures = OrderedDict((f, self.measures[f]) for f in functions)
+
+    def errors(self):
+        '''Half widths of confidence intervals'''
+        return OrderedDict((f, (high - low) / 2.0) for f, (low, high) in self.intervals.iteritems())
+
+    def _z(self, tests=1):
+        '''Normal quantile for confidence level split between tests'''
+        from scipy.stats import norm
+        return norm.isf((1 - self.confidence) / 2.0 / tests)
+
+    def _estimate_c3_c4(self, functions):
+        rng = numpy.random.RandomState(self.pairs_seed)
+        array = self.profile.get_array()
+        m = len(array)
+        z = self._z()
+        total, total_squared, count = 0.0, 0.0, 0
+        if m * (m - 1) <= SAMPLE_BATCH_SIZE:
+            # all pairs are fewer than one batch of samples
+            mean, error = self.profile.d_mean(), 0.0
+        else:
+            while True:
+                first = rng.randint(0, m, SAMPLE_BATCH_SIZE)
+                second = rng.randint(0, m - 1, SAMPLE_BATCH_SIZE)
+                second += second >= first  # pairs of different elements
+                distances = self.profile.pair_distances(array[first], array[second])
+                total += distances.sum()
+                total_squared += (distances ** 2).sum()
+                count += SAMPLE_BATCH_SIZE
+                mean = total / count
+                error = z * sqrt(max(0.0, total_squared / count - mean ** 2) / (count - 1))
+                if count > SAMPLE_BATCH_SIZE and error <= self.tolerance or count >= MAX_SAMPLE_SIZE:
+                    break
+        # d_t_mean = d_mean (n - 1) / (n + 1)
+        for f, factor in [('c3', 1.0), ('c4', (m - 1.0) / (m + 1))]:
+            if f in functions:
+                self.measures[f] = 1 - factor * mean
+                self.intervals[f] = (1 - factor * (mean + error), 1 - factor * (mean - error))
+                self.samples[f] = count
+
+    def _estimate_c2(self):
+        rng = numpy.random.RandomState(self.c2_seed)
+        elements, weights, _ = self.profile.get_unique()
+        array = self.profile.get_array()
+        m = len(array)
+        active = numpy.flatnonzero(weights)
+        sums = numpy.zeros(len(active))
+        sums_squared = numpy.zeros(len(active))
+        size, count, round_ = 64, 0, 0
+        while True:
+            round_ += 1
+            reference = array[rng.randint(0, m, size)]
+            rows = max(1, MATRIX_BLOCK_SIZE ** 2 // size)
+            for start in xrange(0, len(active), rows):
+                distances = self.profile.distances(elements[active[start:start + rows]], reference)
+                sums[start:start + rows] += distances.sum(1)
+                sums_squared[start:start + rows] += (distances ** 2).sum(1)
+            count += size
+            means = sums / count
+            deviations = numpy.sqrt(numpy.maximum(0, sums_squared / count - means ** 2) / (count - 1))
+            # self distances are 0, average over the other elements is m / (m - 1) times larger,
+            # bounds hold for all active elements and all rounds together
+            estimates = means * m / (m - 1)
+            errors = self._z(len(active) * 2 ** round_) * deviations * m / (m - 1)
+            keep = estimates + errors >= (estimates - errors).max()
+            active, sums, sums_squared = active[keep], sums[keep], sums_squared[keep]
+            estimates, errors = estimates[keep], errors[keep]
+            if len(active) * m <= MATRIX_BLOCK_SIZE ** 2 or 2 * count >= m:
+                # exact average distances are cheaper than a larger sample
+                estimates = self.profile.distances(elements[active], elements).dot(weights) / (m - 1)
+                errors = numpy.zeros(len(active))
+                break
+            if errors.max() <= self.tolerance or count >= MAX_SAMPLE_SIZE:
+                break
+            size = count  # double the sample
+        estimate = estimates.max()
+        self.measures['c2'] = 1 - estimate
+        self.intervals['c2'] = (1 - (estimates + errors).max(), 1 - (estimates - errors).max())
+        self.samples['c2'] = count
+
+
+class BinaryProfileBatch(object):
+    '''count binary profiles of the same size stored as one (count, n, length)
+    array of bits. Consistency functions are computed for all profiles at once
+    and return arrays with one value per profile.'''
+
+    def __init__(self, count, n, length, hide_progress=True):
+        self.count = count
+        self.n = n
+        self.length = length
+        self.hide_progress = hide_progress
+        self.array = None
+        self.column_counts = None
+
+    def generate(self, seeds=None):
+        '''Generates every profile from its own seed, the same way as
+        BinaryProfile.generate does'''
+        seeds = seeds if seeds is not None else [None] * self.count
+        rngs = [numpy.random.RandomState(s) if s is not None else numpy.random for s in seeds]
+        self.array = numpy.array([rng.randint(0, 2, size=(self.n, self.length)) for rng in rngs],
+            dtype=numpy.uint8)
+        self.column_counts = None
+        return self.array
+
+    def profile(self, i):
+        '''Returns i-th profile of batch as BinaryProfile'''
+        profile = BinaryProfile(self.n, self.length, hide_progress=self.hide_progress)
+        profile.array = pack_binary(self.array[i])
+        return profile
+
+    def get_column_counts(self):
+        if self.column_counts is None:
+            self.column_counts = self.array.sum(1, dtype=numpy.int64)
+        return self.column_counts
+
+    def profile_diameter(self):
+        packed = numpy.packbits(self.array, axis=2)
+        result = numpy.empty(self.count, dtype=numpy.int64)
+        step = max(1, (MATRIX_BLOCK_SIZE ** 2) // max(1, self.n ** 2))
+        for start in xrange(0, self.count, step):
+            block = packed[start:start + step]
+            distances = numpy.zeros((len(block), self.n, self.n), dtype=numpy.int64)
+            for i in xrange(block.shape[2]):
+                distances += POPCOUNT_TABLE[numpy.bitwise_xor(
+                    block[:, :, numpy.newaxis, i], block[:, numpy.newaxis, :, i])]
+            result[start:start + step] = distances.max(2).max(1)
+        return result / float(self.length)
+
+    def sum_of_distances_for_element(self, x):
+        '''d(x_i, X_i) for every profile X_i and its element x_i (row of x)'''
+        counts = self.get_column_counts()
+        x = numpy.asarray(x, dtype=numpy.int64)
+        return (counts.sum(1) + (x * (self.n - 2 * counts)).sum(1)) / float(self.length)
+
+    def get_vectors(self):
+        '''Vectors of average distances - (count, n) array'''
+        counts = self.get_column_counts()
+        sums = counts.sum(1)[:, numpy.newaxis] + numpy.einsum('knl,kl->kn',
+            self.array.astype(numpy.int64), self.n - 2 * counts)
+        return sums / float(self.length) / float(self.n - 1)
+
+    def vector_diameter(self):
+        return self.get_vectors().max(1)
+
+    def _sum_of_distances(self):
+        counts = self.get_column_counts()
+        return 2 * (counts * (self.n - counts)).sum(1).astype(float) / self.length
+
+    def d_mean(self):
+        return self._sum_of_distances() / (self.n * (self.n - 1))
+
+    def d_t_mean(self):
+        return self._sum_of_distances() / (self.n * (self.n + 1))
+
+    def minimal_avg_distance(self):
+        counts = self.get_column_counts()
+        return numpy.minimum(counts, self.n - counts).sum(1) / float(self.length) / self.n
+
+    def c1(self):
+        return 1 - self.profile_diameter()
+
+    def c2(self):
+        return 1 - self.vector_diameter()
+
+    def c3(self):
+        return 1 - self.d_mean()
+
+    def c4(self):
+        return 1 - self.d_t_mean()
+
+    def c5(self):
+        return 1 - self.minimal_avg_distance()
+
+    def quality(self, x):
+        return 1 - self.sum_of_distances_for_element(x) / self.n
+
+
+class SlidingWindowMonitor(object):
+    '''Consistency of the last window elements of a stream of binary vectors.
+    Every arrival replaces the oldest element of BinaryProfile in O(window)
+    (see Profile.add_element). Histogram of pairwise hamming distances keeps
+    the profile diameter without the matrix of distances, other measures and
+    the O1 consensus come from column counts.'''
+
+    def __init__(self, window, length, hide_progress=True):
+        self.window = window
+        self.length = length
+        self.arrivals = 0
+        self.profile = BinaryProfile(0, length, hide_progress=hide_progress)
+        self.distance_counts = numpy.zeros(length + 1, dtype=numpy.int64)
+
+    def _count_distances(self, packed_x, sign):
+        '''Adds (sign=1) or subtracts (sign=-1) distances between x and all
+        profile elements to the histogram'''
+        elements, weights, _ = self.profile.get_unique()
+        distances = self.profile.raw_distances(packed_x, elements)[0][0]
+        self.distance_counts += sign * numpy.bincount(distances, weights,
+            minlength=self.length + 1).astype(numpy.int64)
+
+    def push(self, x):
+        '''Adds x to the window, removing the oldest element if it is full'''
+        profile = self.profile
+        if profile.n == self.window:
+            removed = profile.get_array()[:1]
+            profile.remove_element(0)
+            self._count_distances(removed, -1)
+        packed_x = profile.as_array([x])
+        self._count_distances(packed_x, 1)
+        profile.add_element(x)
+        # distinct elements which left the window are dropped from time to time
+        if len(profile.get_unique()[0]) > 2 * self.window:
+            profile.compact()
+        self.arrivals += 1
+
+    def profile_diameter(self):
+        return numpy.flatnonzero(self.distance_counts).max() / float(self.length)
+
+    def measures(self):
+        '''Consistency functions c1-c5 of the current window'''
+        profile = self.profile
+        result = OrderedDict()
+        result['c1'] = 1 - self.profile_diameter()
+        result['c2'] = profile.c2()
+        result['c3'] = profile.c3()
+        result['c4'] = profile.c4()
+        result['c5'] = profile.c5()
+        return result
+
+    def consensus(self):
+        return ConsensusO1.run(self.profile)
+
+    def run(self, vectors, every=1):
+        '''Pushes vectors one by one and yields tuples (number of arrivals,
+        measures, O1 consensus) after every k-th arrival (once the window
+        holds at least two elements)'''
+        for x in vectors:
+            self.push(x)
+            if self.arrivals % every == 0 and self.profile.n > 1:
+                yield self.arrivals, self.measures(), self.consensus()
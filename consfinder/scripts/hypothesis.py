@@ -5,13 +5,12 @@ import sys
 import random
 import numpy
 import time
-from itertools import product
 from clint.textui import colored, puts, indent
-from clint.textui import progress
 
 from consfinder.profiles import Profile
-from consfinder.functions import ConsensusO2, euclidean_distance, euclidean_distance_norm
-from consfinder.config import RESULTS_DIR
+from consfinder.functions import (BoundedConsensusCollector, ConsensusResult, NOptimalityAlgorithm, SearchControl,
+    euclidean_distance, euclidean_distance_norm, euclidean_distance_norm_matrix, minmax)
+from consfinder.config import RESULTS_DIR, CACHE_DIR
 
 try:
     from matplotlib import pyplot as plt
@@ -34,6 +33,67 @@ def euclidean_distance_norm(vector_x, vector_y):
     return result
 
 
+_euclidean_distance_norm_matrix = euclidean_distance_norm_matrix
+def euclidean_distance_norm_matrix(elements_x, elements_y):
+    return _euclidean_distance_norm_matrix(elements_x, elements_y, 0, MAX_DISTANCE)
+
+
+def _round(values, precision):
+    '''Vectorized built-in round() - numpy.round rounds halves to even and
+    works on scaled values, so values close to halves are rounded by round()'''
+    result = numpy.round(values, precision)
+    scaled = values * pow(10, precision)
+    halves = numpy.abs(scaled - numpy.floor(scaled) - 0.5) < 1e-6
+    result[halves] = [round(v, precision) for v in values[halves].tolist()]
+    return result
+
+
+def _build_euclidean_space(radius):
+    '''Returns (universe, perimeter) - arrays of points of the grid with step
+    10^-FLOAT_PRECISION inside the disc and on the circle of given radius'''
+    step = 1.0 / pow(10, FLOAT_PRECISION)
+    rounded = numpy.array([round(x, FLOAT_PRECISION)
+        for x in numpy.arange(-1, 1 + step, step).tolist()])
+    grid = numpy.column_stack([numpy.repeat(rounded, len(rounded)), numpy.tile(rounded, len(rounded))])
+    sum_squared = _round(grid[:, 0] ** 2 + grid[:, 1] ** 2, FLOAT_PRECISION)
+    r_squared = round(radius ** 2, FLOAT_PRECISION)
+    return grid[sum_squared <= r_squared], grid[sum_squared == r_squared]
+
+
+_euclidean_spaces = {}
+
+def get_euclidean_space(radius=MAX_RADIUS):
+    '''Returns (universe, perimeter) for given radius. Points are cached on
+    disk as integer grid coordinates and shared within the process.'''
+    key = (FLOAT_PRECISION, radius)
+    if key not in _euclidean_spaces:
+        scale = pow(10, FLOAT_PRECISION)
+        path = os.path.join(CACHE_DIR, 'euclidean_space_p%s_r%s.npz' % key)
+        try:
+            cached = numpy.load(path)
+            universe, perimeter = cached['universe'] / float(scale), cached['perimeter'] / float(scale)
+        except (IOError, KeyError, ValueError):
+            universe, perimeter = _build_euclidean_space(radius)
+            tmp_path = '%s.%s.tmp' % (path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                numpy.savez(f, universe=numpy.round(universe * scale).astype(numpy.int16),
+                    perimeter=numpy.round(perimeter * scale).astype(numpy.int16))
+            os.rename(tmp_path, path)
+        _euclidean_spaces[key] = universe, perimeter
+    return _euclidean_spaces[key]
+
+
+_universe_indexes = {}
+
+def get_universe_index(universe):
+    '''Returns KD-tree of universe points, shared for the same universe array'''
+    from scipy.spatial import cKDTree
+    key = id(universe)
+    if key not in _universe_indexes or _universe_indexes[key][0] is not universe:
+        _universe_indexes[key] = (universe, cKDTree(universe))
+    return _universe_indexes[key][1]
+
+
 def get_rand_radius():
     # max_radius = 0.5 # normalized
     while True:
@@ -48,43 +108,43 @@ class EuclideanProfile(Profile):
     def __init__(self, n, universe=[], perimeter=[], **kwargs):
         '''Creates a profile of (x,y) pairs where both x and y belong to [-1, 1]
         and each element have identical distance to real state (0,0)'''
-        super(EuclideanProfile, self).__init__(n, length=2, distance_func=euclidean_distance_norm, **kwargs)
+        super(EuclideanProfile, self).__init__(n, length=2, distance_func=euclidean_distance_norm,
+            distance_matrix_func=euclidean_distance_norm_matrix, **kwargs)
         self.real_state = REAL_STATE
         self.radius = MAX_RADIUS
-        if universe and perimeter:
+        if len(universe) and len(perimeter):
             self.universe = universe
             self.perimeter = perimeter
         else:
-            self.perimeter = []
-            self.universe = []
             self._init_universe()
 
     def _init_universe(self, radius=1):
-        step = 1.0 / pow(10, FLOAT_PRECISION)
-        elements = numpy.arange(-1, 1 + step, step).tolist()
-        rounded = [round(x, FLOAT_PRECISION) for x in elements]
-        
-        r_squared = radius ** 2
-        delta = pow(10, FLOAT_PRECISION)
-
-        for x in progress.bar(list(product(rounded, repeat=2)), hide=self.hide_progress):
-            _sum_squared = x[0] ** 2 + x[1] ** 2
-            if round(_sum_squared, FLOAT_PRECISION) == round(r_squared, FLOAT_PRECISION):
-                self.perimeter.append(x)
-                self.universe.append(x)
-            elif round(_sum_squared, FLOAT_PRECISION) < round(r_squared, FLOAT_PRECISION):
-                self.universe.append(x)
-
-    def generate(self, equal_dist=True, **kwargs):
+        self.universe, self.perimeter = get_euclidean_space(radius)
+
+    def generate(self, equal_dist=True, seed=None, **kwargs):
         self.equal_dist = equal_dist
-        if self.equal_dist:
-            self.elements = [random.choice(self.perimeter) for _ in range(self.n)]
-        else:
-            self.elements = [random.choice(self.universe) for _ in range(self.n)]
+        rng = random.Random(seed) if seed is not None else random
+        points = self.perimeter if self.equal_dist else self.universe
+        self.array = None
+        self.clear_cache()
+        self.elements = [tuple(rng.choice(points).tolist()) for _ in range(self.n)]
 
     def quality(self, x):
         return 1 - euclidean_distance(x, REAL_STATE)
 
+    def quality_for_sum(self, x, d_x_X):
+        return self.quality(x)
+
+    def pair_distances(self, elements_x, elements_y):
+        x, y = numpy.asarray(elements_x), numpy.asarray(elements_y)
+        return minmax(numpy.sqrt(((x - y) ** 2).sum(1)), 0, MAX_DISTANCE)
+
+    def nearest_universe_points(self, point, k=1):
+        '''Returns k points of the universe nearest to given point'''
+        universe = self.get_universe()
+        _, indices = get_universe_index(universe).query(point, k=min(k, len(universe)))
+        return [tuple(x) for x in universe[numpy.atleast_1d(indices)].tolist()]
+
     def _draw_fig(self, extra):
         if not HAS_PYPLOT:
             print "Module matplotlib.pyplot is not installed"
@@ -117,6 +177,93 @@ class EuclideanProfile(Profile):
             plt.clf()
 
 
+class ContinuousConsensusAlgorithm(NOptimalityAlgorithm):
+    '''n-optimal consensus for EuclideanProfile found in the plane instead of
+    by scanning the grid. With snap the result is moved to the best of
+    SNAP_CANDIDATES universe points nearest to the solution, so it can be
+    compared with the grid consensus.'''
+    n = None
+    SNAP_CANDIDATES = 9
+
+    @classmethod
+    def solve(cls, profile):
+        raise NotImplementedError()
+
+    @classmethod
+    def run(cls, profile, control=None, snap=True):
+        point = cls.solve(profile)
+        if not snap:
+            return ConsensusResult([tuple(point.tolist())])
+        candidates = cls._snap_candidates(profile, point, cls.SNAP_CANDIDATES, (cls.n,))
+        return cls._select(((x, sums[0]) for x, sums in candidates), control, cls.SNAP_CANDIDATES)
+
+    @classmethod
+    def run_top(cls, profile, k=1, control=None):
+        '''k best of k + SNAP_CANDIDATES universe points nearest to the
+        solution (the extra ones resolve ties of the k-th candidate), ranked
+        like NOptimalityAlgorithm.run_top'''
+        collector = BoundedConsensusCollector(k, profile.quality_for_sum)
+        powers = (cls.n,) if cls.n == 1 else (cls.n, 1)
+        size = k + cls.SNAP_CANDIDATES
+        def add((x, sums)):
+            collector.add(x, *sums)
+        control = control or SearchControl()
+        exhaustive = control.run(cls._snap_candidates(profile, cls.solve(profile), size, powers), add, size)
+        return collector.result(exhaustive)
+
+    @classmethod
+    def _snap_candidates(cls, profile, point, k, powers):
+        '''Pairs (x, list of d(x,X) for every power) for k universe points
+        nearest to point, computed like universe_power_sums, so ties are
+        rounded the same way as in the grid scan'''
+        candidates = profile.nearest_universe_points(point, k)
+        elements, weights, _ = profile.get_unique()
+        distances = profile.distances(profile.as_array(candidates), elements)
+        sums = numpy.column_stack([(distances ** n).dot(weights) for n in powers])
+        return zip(candidates, sums.tolist())
+
+
+class EuclideanConsensusO1(ContinuousConsensusAlgorithm):
+    '''Geometric median of profile (modified Weiszfeld algorithm of Vardi
+    and Zhang, which does not get stuck in profile elements)'''
+    name = 'EuclideanConsensusO1'
+    n = 1
+
+    @classmethod
+    def solve(cls, profile, tolerance=1e-10, max_iterations=1000):
+        elements, weights, _ = profile.get_unique()
+        elements = elements.astype(float)
+        weights = weights.astype(float)
+        x = weights.dot(elements) / weights.sum()
+        for _ in xrange(max_iterations):
+            dist = numpy.sqrt(((elements - x) ** 2).sum(1))
+            same = dist < tolerance
+            inv = weights[~same] / dist[~same]
+            if not len(inv):
+                return x
+            t = inv.dot(elements[~same]) / inv.sum()
+            eta = weights[same].sum()
+            r = numpy.sqrt(((inv.dot(elements[~same] - x)) ** 2).sum())
+            ratio = eta / r if r > 0 else 1.0
+            new_x = max(0.0, 1 - ratio) * t + min(1.0, ratio) * x
+            if numpy.sqrt(((new_x - x) ** 2).sum()) < tolerance:
+                return new_x
+            x = new_x
+        return x
+
+
+class EuclideanConsensusO2(ContinuousConsensusAlgorithm):
+    '''Centroid of profile. d(x,X) = n|x - c|^2 + const for the centroid c, so
+    the snapped result is exactly the grid consensus.'''
+    name = 'EuclideanConsensusO2'
+    n = 2
+
+    @classmethod
+    def solve(cls, profile):
+        elements, weights, _ = profile.get_unique()
+        return weights.dot(elements.astype(float)) / weights.sum()
+
+
 def process_hypothesis(profile, show_profile=True, radius=None):
     print profile.get_matrix()
     print
@@ -134,7 +281,7 @@ def process_hypothesis(profile, show_profile=True, radius=None):
         puts("c5: %.3f" % profile.c5())
 
     puts(colored.green('\n==o2 consensus (quality)'))
-    consensus_o2 = ConsensusO2.run(profile)
+    consensus_o2 = EuclideanConsensusO2.run(profile)
     with indent(2, ''):
         for con in consensus_o2:
             puts("%s (%s)" % (con, profile.quality(con)))
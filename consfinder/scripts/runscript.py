@@ -13,16 +13,18 @@ def test_n():
 
 def binary_run_bulk(params, count=25):
 	em = ExperimentsManager()
-	for (length, number) in params:
-		print "Running case: ", number, length
-		# em.run_experiment(count, number, length, algorithms=['OptimalAlgorithm', 'ConsensusO2'])
-		em.run_experiment(count, number, length)
+	with em.bulk():
+		for (length, number) in params:
+			print "Running case: ", number, length
+			# em.run_experiment(count, number, length, algorithms=['OptimalAlgorithm', 'ConsensusO2'])
+			em.run_experiment(count, number, length)
 
 def euclidean_run_bulk(params, count=25):
 	em = EuclideanExperimetsManager()
-	for number in params:
-		print "Running case: ", number
-		em.run_experiment(count, number, no_equal=True)
+	with em.bulk():
+		for number in params:
+			print "Running case: ", number
+			em.run_experiment(count, number, no_equal=True)
 
 
 if __name__ == '__main__':
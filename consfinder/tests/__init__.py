@@ -0,0 +1,31 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from consfinder import databases, experiments_manager
+from consfinder.scripts import hypothesis
+
+
+class TemporaryResultsTestCase(unittest.TestCase):
+    '''Results database, caches and exported files of tests are kept in
+    a temporary directory instead of the results directory of the user'''
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.patched = []
+        self.patch(databases, 'SQLITE_PATH', os.path.join(self.results_dir, 'results.sqlite'))
+        self.patch(experiments_manager, 'CACHE_DIR', self.results_dir)
+        self.patch(experiments_manager, 'CSV_DST', self.results_dir)
+        self.patch(hypothesis, 'CACHE_DIR', self.results_dir)
+
+    def patch(self, module, name, value):
+        self.patched.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def tearDown(self):
+        for module, name, value in reversed(self.patched):
+            setattr(module, name, value)
+        shutil.rmtree(self.results_dir)
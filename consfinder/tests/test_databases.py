@@ -0,0 +1,60 @@
+# coding: utf-8
+
+import os
+import json
+import unittest
+
+from consfinder.tests import TemporaryResultsTestCase
+from consfinder.databases import SQLiteStore, Row, view_value
+
+
+def result_doc(no, length, n):
+    return {'timestamp': no, 'params': {'length': length, 'n': n, 'no': no},
+        'consistency': {'c1': [no / 100.0]}, 'consensus': {'ConsensusO1': [no]}}
+
+
+class SQLiteStoreTest(TemporaryResultsTestCase):
+
+    def setUp(self):
+        super(SQLiteStoreTest, self).setUp()
+        self.path = os.path.join(self.results_dir, 'results.sqlite')
+        # keys repeat and are saved out of order, so pages end inside groups of equal keys
+        self.docs = [result_doc(no, 4 + no % 3, 5 + no % 4) for no in range(23)]
+        SQLiteStore(self.path, 'results', ['length', 'n']).save_many(self.docs)
+
+    def unpaginated(self, store, key=None):
+        query = 'SELECT doc FROM results'
+        if key is not None:
+            query += ' WHERE ' + ' AND '.join('%s = ?' % p for p in store.key_params)
+        query += ' ORDER BY %s' % ', '.join(store.key_params + ['id'])
+        docs = [json.loads(doc) for doc, in store.connection.execute(query, key or [])]
+        return [Row(store.key(doc), view_value(doc)) for doc in docs]
+
+    def test_pages_equal_unpaginated_query(self):
+        for key_params in [['length', 'n'], ['n']]:
+            store = SQLiteStore(self.path, 'results', key_params)
+            expected = self.unpaginated(store)
+            self.assertEqual(len(expected), len(self.docs))
+            for page_size in [1, 4, 23, 100]:
+                self.assertEqual(list(store.iter_results(page_size=page_size)), expected)
+
+    def test_pages_of_key(self):
+        store = SQLiteStore(self.path, 'results', ['length', 'n'])
+        for key in [[4, 5], [5, 6], [9, 9]]:
+            expected = self.unpaginated(store, key)
+            self.assertEqual(list(store.iter_results(key, page_size=1)), expected)
+            self.assertEqual(store.results(key), expected)
+
+    def test_version_changes_with_saved_docs(self):
+        store = SQLiteStore(self.path, 'results', ['length', 'n'])
+        version = store.version()
+        store.save(result_doc(23, 4, 5))
+        self.assertNotEqual(store.version(), version)
+        self.assertEqual(len(store.results([4, 5])), len(self.unpaginated(store, [4, 5])))
+
+    def test_unknown_key_column(self):
+        self.assertRaises(ValueError, SQLiteStore, self.path, 'results', ['radius'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# coding: utf-8
+
+import os
+import csv
+import json
+import unittest
+
+import numpy
+
+from consfinder.tests import TemporaryResultsTestCase
+from consfinder.databases import RunCache
+from consfinder.experiments_manager import (ExperimentsManager, analyze_group, map_runs, run_binary_single,
+    run_binary_batch, CONSISTENCY_FUNCTIONS)
+from consfinder.functions import DEFAULT_ALGORITHMS
+from consfinder.utils import derive_seeds
+
+
+NUMBER, LENGTH = 8, 5
+
+
+def binary_tasks(seeds):
+    return [(no, seed, NUMBER, LENGTH, CONSISTENCY_FUNCTIONS, DEFAULT_ALGORITHMS, None, 'float64', None, 0.95)
+        for no, seed in enumerate(seeds, 1)]
+
+
+class BinaryRunsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.seeds = derive_seeds(11, 6)
+        self.serial = [run_binary_single(task) for task in binary_tasks(self.seeds)]
+
+    def assertSameRows(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        for row, expected_row in zip(rows, expected):
+            self.assertEqual(row.keys(), expected_row.keys())
+            for name, value in expected_row.iteritems():
+                self.assertAlmostEqual(row[name], value, places=10, msg=name)
+
+    def test_workers(self):
+        self.assertSameRows(map_runs(run_binary_single, binary_tasks(self.seeds), workers=2), self.serial)
+
+    def test_batch(self):
+        self.assertSameRows(run_binary_batch(self.seeds, NUMBER, LENGTH, CONSISTENCY_FUNCTIONS, DEFAULT_ALGORITHMS),
+            self.serial)
+
+
+class RunCacheTest(TemporaryResultsTestCase):
+
+    def setUp(self):
+        super(RunCacheTest, self).setUp()
+        self.manager = ExperimentsManager('sqlite')
+        self.manager.cache = RunCache(os.path.join(self.results_dir, 'runs'))
+
+    def run_experiment(self, count, algorithms, no_cache=False):
+        return self.manager.run_experiment(count, NUMBER, LENGTH, algorithms=algorithms, no_db=True, seed=7,
+            no_cache=no_cache)['data']
+
+    def test_cached_rows_equal_fresh_rows(self):
+        self.run_experiment(4, ['ConsensusO1'])
+        # the first four runs are taken from cache, ConsensusO2 is computed for all of them
+        cached = self.run_experiment(8, ['ConsensusO1', 'ConsensusO2'])
+        self.assertEqual(cached, self.run_experiment(8, ['ConsensusO1', 'ConsensusO2'], no_cache=True))
+        self.assertEqual(cached, self.run_experiment(8, ['ConsensusO1', 'ConsensusO2']))
+
+
+class ExportResultsTest(TemporaryResultsTestCase):
+
+    def setUp(self):
+        super(ExportResultsTest, self).setUp()
+        self.manager = ExperimentsManager('sqlite')
+        docs = [{'params': {'n': n, 'length': 6, 'seed': n}, 'timestamp': n,
+            'consistency': {'c1': [0.5, 0.25, 0.125][:n - 3], 'c3': [0.75, 0.5]},
+            'consensus': {'ConsensusO1': [1, 2]}} for n in [5, 4, 6, 5]]
+        self.manager.db.save_many(docs)
+
+    def test_csv(self):
+        self.assertEqual(self.manager.export_results('results.csv', page_size=3), 4)
+        expected = []
+        for value in [row.value for row in self.manager.db.results()]:
+            expected.append(['%s: %s' % (k, v) for k, v in value['params'].iteritems()])
+            fields = sorted(k for k in value if k not in ('timestamp', 'params'))
+            expected.append(fields)
+            for i in range(max(len(value[f]) for f in fields)):
+                expected.append([str(value[f][i]).replace('.', ',') if i < len(value[f]) else '' for f in fields])
+            expected.append(['\n'])
+        with open(os.path.join(self.results_dir, 'results.csv')) as f:
+            self.assertEqual(list(csv.reader(f, delimiter=';')), expected)
+
+    def test_npz_of_key(self):
+        self.assertEqual(self.manager.export_results('results.npz', key=[6, 5], page_size=1), 2)
+        archive = numpy.load(os.path.join(self.results_dir, 'results.npz'))
+        values = [row.value for row in self.manager.db.results([6, 5])]
+        self.assertEqual(len(archive.files), 4 * len(values))
+        for i, value in enumerate(values):
+            self.assertEqual(json.loads(str(archive['%s_params' % i])), value['params'])
+            for field in ['c1', 'c3', 'ConsensusO1']:
+                self.assertEqual(archive['%s_%s' % (i, field)].tolist(), value[field])
+
+
+class AnalyzeGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        data = rng.rand(30, 3)
+        data[:, 1] += data[:, 0]
+        data[:, 2] = numpy.round(data[:, 2] * 4)  # ties of ranks
+        self.data = numpy.column_stack([data, numpy.ones(30)])
+        self.result = analyze_group(([6, 5], ['c1', 'c2', 'c3', 'ConsensusO1'], self.data, 200, 0.9, 3))
+
+    def test_correlations_equal_scipy(self):
+        from scipy.stats import pearsonr, spearmanr
+        for i in range(3):
+            for j in range(3):
+                for name, correlation in [('pearson', pearsonr), ('spearman', spearmanr)]:
+                    r, p = correlation(self.data[:, i], self.data[:, j])
+                    self.assertAlmostEqual(self.result[name][i][j], r, places=10)
+                    if i != j:
+                        self.assertAlmostEqual(self.result['%s_p' % name][i][j], p, places=10)
+        # constant variable has no correlations
+        self.assertTrue(numpy.isnan(self.result['pearson'][0][3]))
+        self.assertTrue(numpy.isnan(self.result['spearman_p'][3][1]))
+
+    def test_shapiro_equals_scipy(self):
+        from scipy.stats import shapiro
+        for i in range(3):
+            numpy.testing.assert_allclose(self.result['shapiro'][i], shapiro(self.data[:, i]))
+
+    def test_bootstrap_intervals(self):
+        from scipy.stats import pearsonr, spearmanr
+        resamples = numpy.random.RandomState(3).randint(0, 30, (200, 30))
+        for name, correlation in [('pearson', pearsonr), ('spearman', spearmanr)]:
+            values = [correlation(self.data[r, 0], self.data[r, 2])[0] for r in resamples]
+            numpy.testing.assert_allclose(self.result['%s_ci' % name][0][2],
+                [numpy.percentile(values, 5), numpy.percentile(values, 95)])
+
+
+if __name__ == '__main__':
+    unittest.main()
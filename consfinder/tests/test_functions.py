@@ -0,0 +1,147 @@
+# coding: utf-8
+
+import unittest
+from itertools import product, islice
+
+from consfinder.profiles import Profile, BinaryProfile
+from consfinder.functions import (ConsensusO1, ConsensusO2, ConsensusO2BranchAndBound, manhattan_dist,
+    ProgressCallback, SearchControl, FLOAT_PRECISION)
+
+
+def pairwise_profile(profile):
+    '''Profile of the same elements measured from pairwise manhattan distances
+    and scanning of the universe - the baseline of binary closed forms'''
+    baseline = Profile(profile.n, profile.length, distance_func=manhattan_dist)
+    baseline.elements = profile.elements
+    baseline.universe = [list(x) for x in product([0, 1], repeat=profile.length)]
+    return baseline
+
+
+class BinaryClosedFormsTest(unittest.TestCase):
+
+    def assertSameMeasures(self, functions):
+        for seed in range(5):
+            profile = BinaryProfile(9 + seed, 6)
+            profile.generate(seed=seed)
+            baseline = pairwise_profile(profile)
+            for f in functions:
+                self.assertAlmostEqual(getattr(profile, f)(), getattr(baseline, f)(), places=10, msg=f)
+
+    def test_c2_c3_c4_equal_pairwise_baseline(self):
+        self.assertSameMeasures(['c2', 'c3', 'c4'])
+
+    def test_c5_equals_pairwise_baseline(self):
+        self.assertSameMeasures(['c5'])
+
+    def test_o1_equals_universe_scan(self):
+        for seed in range(5):
+            profile = BinaryProfile(8 + seed, 6)
+            profile.generate(seed=seed)
+            self.assertEqual(sorted(tuple(x) for x in ConsensusO1.run(profile)),
+                sorted(tuple(x) for x in ConsensusO1.run(pairwise_profile(profile))))
+
+    def test_o1_top_k_equals_universe_scan(self):
+        # odd and even number of elements, with and without tied columns
+        for seed in range(6):
+            profile = BinaryProfile(8 + seed, 7)
+            profile.generate(seed=seed)
+            baseline = pairwise_profile(profile)
+            for k in [1, 4, 40]:
+                expected = ConsensusO1.run_top(baseline, k)
+                result = ConsensusO1.run_top(profile, k)
+                self.assertEqual([tuple(x) for x in result], [tuple(x) for x in expected])
+                self.assertEqual(result.distances, expected.distances)
+                self.assertEqual(result.ties, expected.ties)
+                self.assertAlmostEqual(result.best_quality, expected.best_quality, places=10)
+
+
+class CancellingCallback(ProgressCallback):
+
+    def __init__(self):
+        self.control = None
+        self.updates = []
+
+    def update(self, done, total):
+        self.updates.append((done, total))
+        self.control.cancel()
+
+
+class SearchControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = BinaryProfile(7, 8)
+        self.profile.generate(seed=3)
+
+    def first_candidates(self, count):
+        '''O2 consensus of the first count candidates of the scan'''
+        return ConsensusO2._select(islice(self.profile.universe_sums(2), count))
+
+    def test_max_iterations(self):
+        result = ConsensusO2.run(self.profile, SearchControl(max_iterations=10))
+        self.assertFalse(result.exhaustive)
+        self.assertEqual(list(result), list(self.first_candidates(10)))
+
+    def test_budget_of_whole_universe_is_exhaustive(self):
+        result = ConsensusO2.run(self.profile, SearchControl(max_iterations=2 ** 8))
+        self.assertTrue(result.exhaustive)
+        self.assertEqual(list(result), list(ConsensusO2.run(self.profile, SearchControl())))
+
+    def test_time_limit_is_checked_every_candidates(self):
+        result = ConsensusO2.run(self.profile, SearchControl(time_limit=0, every=5))
+        self.assertFalse(result.exhaustive)
+        self.assertEqual(list(result), list(self.first_candidates(5)))
+
+    def test_cancel_from_callback(self):
+        callback = CancellingCallback()
+        control = callback.control = SearchControl(callback=callback, every=4)
+        result = ConsensusO2.run(self.profile, control)
+        self.assertFalse(result.exhaustive)
+        self.assertEqual(callback.updates, [(4, 2 ** 8)])
+        self.assertEqual(list(result), list(self.first_candidates(4)))
+
+    def test_branch_and_bound_stops_within_budget(self):
+        result = ConsensusO2BranchAndBound.run(self.profile, SearchControl(max_iterations=10))
+        self.assertFalse(result.exhaustive)
+        self.assertTrue(ConsensusO2BranchAndBound.run(self.profile, SearchControl()).exhaustive)
+
+
+class LongVectorsTest(unittest.TestCase):
+
+    def test_o2_scan_of_universe_larger_than_int64(self):
+        profile = BinaryProfile(10, 70)
+        profile.generate(seed=1)
+        result = ConsensusO2.run(profile, SearchControl(max_iterations=100))
+        self.assertFalse(result.exhaustive)
+        self.assertEqual(len(result[0]), 70)
+
+
+class BranchAndBoundTest(unittest.TestCase):
+
+    def test_same_ties_as_universe_scan(self):
+        for seed in range(10):
+            profile = BinaryProfile(6 + seed % 5, 8 + seed % 3)
+            profile.generate(seed=seed)
+            self.assertEqual(list(ConsensusO2BranchAndBound.run(profile)), list(ConsensusO2.run(profile)))
+
+    def test_vectors_longer_than_recursion_limit(self):
+        profile = BinaryProfile(5, 1200)
+        profile.generate(seed=1)
+        # the first leaf is reached after 1200 nodes
+        result = ConsensusO2BranchAndBound.run(profile, SearchControl(max_iterations=3000))
+        self.assertEqual(len(result[0]), 1200)
+
+    def test_top_k_equals_universe_scan(self):
+        profile = BinaryProfile(9, 8)
+        profile.generate(seed=4)
+        for k in [1, 5, 30]:
+            expected = ConsensusO2.run_top(profile, k)
+            result = ConsensusO2BranchAndBound.run_top(profile, k)
+            self.assertEqual(list(result), list(expected))
+            self.assertEqual(result.distances, expected.distances)
+            self.assertEqual(result.ties, expected.ties)
+            self.assertEqual(round(result.best_quality, FLOAT_PRECISION),
+                round(expected.best_quality, FLOAT_PRECISION))
+
+
+if __name__ == '__main__':
+    unittest.main()
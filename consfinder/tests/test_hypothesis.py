@@ -0,0 +1,36 @@
+# coding: utf-8
+
+import unittest
+
+from consfinder.tests import TemporaryResultsTestCase
+from consfinder.functions import ConsensusO1, ConsensusO2
+from consfinder.scripts.hypothesis import EuclideanProfile, EuclideanConsensusO1, EuclideanConsensusO2
+
+
+class ContinuousConsensusTest(TemporaryResultsTestCase):
+
+    def profiles(self):
+        for seed in range(6):
+            profile = EuclideanProfile(5 + seed)
+            profile.generate(equal_dist=seed % 2 == 0, seed=seed)
+            yield profile
+
+    def test_snapped_consensus_equals_grid_scan(self):
+        for profile in self.profiles():
+            self.assertEqual(sorted(EuclideanConsensusO1.run(profile)), sorted(ConsensusO1.run(profile)))
+            self.assertEqual(sorted(EuclideanConsensusO2.run(profile)), sorted(ConsensusO2.run(profile)))
+
+    def test_top_k_equals_grid_scan(self):
+        for profile in self.profiles():
+            for algorithm, grid, k in [(EuclideanConsensusO1, ConsensusO1, 1), (EuclideanConsensusO2, ConsensusO2, 1),
+                    (EuclideanConsensusO2, ConsensusO2, 20)]:
+                expected = grid.run_top(profile, k)
+                result = algorithm.run_top(profile, k)
+                self.assertEqual(list(result), list(expected))
+                self.assertEqual(result.distances, expected.distances)
+                self.assertEqual(result.ties, expected.ties)
+                self.assertEqual(result.best_quality, expected.best_quality)
+
+
+if __name__ == '__main__':
+    unittest.main()
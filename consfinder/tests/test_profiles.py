@@ -0,0 +1,131 @@
+# coding: utf-8
+
+import unittest
+
+import numpy
+
+from consfinder.tests import TemporaryResultsTestCase
+from consfinder.profiles import BinaryProfile, SampledStatistics, SlidingWindowMonitor
+from consfinder.functions import ConsensusO1
+from consfinder.scripts.hypothesis import EuclideanProfile
+
+
+MEASURES = ['c1', 'c2', 'c3', 'c4', 'c5']
+
+
+class IncrementalProfileTest(TemporaryResultsTestCase):
+
+    def assertSameMeasures(self, profile, fresh):
+        self.assertEqual(profile.n, fresh.n)
+        for f in MEASURES:
+            self.assertAlmostEqual(getattr(profile, f)(), getattr(fresh, f)(), places=10, msg=f)
+
+    def test_euclidean_profile_grown_from_empty(self):
+        fresh = EuclideanProfile(8)
+        fresh.generate(equal_dist=False, seed=3)
+        profile = EuclideanProfile(0, universe=fresh.universe, perimeter=fresh.perimeter)
+        for x in fresh.elements:
+            profile.add_element(x)
+        self.assertEqual(profile.elements, fresh.elements)
+        self.assertSameMeasures(profile, fresh)
+
+    def test_binary_profile_grown_from_empty(self):
+        fresh = BinaryProfile(10, 6)
+        fresh.generate(seed=1)
+        profile = BinaryProfile(0, 6)
+        for x in fresh.elements:
+            profile.add_element(x)
+        self.assertEqual(profile.elements, fresh.elements)
+        self.assertSameMeasures(profile, fresh)
+
+    def test_binary_add_remove_replace(self):
+        profile = BinaryProfile(12, 7)
+        elements = profile.generate(seed=5)
+        # cached sums and diameter are updated, not recomputed
+        profile.get_matrix()
+        profile.c1()
+
+        new = [1, 0, 1, 1, 0, 0, 1]
+        profile.add_element(new)
+        elements.append(new)
+        self.assertEqual(profile.remove_element(3), elements.pop(3))
+        self.assertEqual(profile.replace_element(0, elements[5]), elements[0])
+        elements[0] = elements[5]
+
+        fresh = BinaryProfile(len(elements), 7)
+        fresh.elements = elements
+        self.assertEqual(profile.elements, elements)
+        self.assertSameMeasures(profile, fresh)
+
+    def test_euclidean_add_remove_replace(self):
+        profile = EuclideanProfile(9)
+        profile.generate(equal_dist=False, seed=7)
+        elements = list(profile.elements)
+        profile.get_matrix()
+        profile.c1()
+
+        profile.add_element((0.5, 0.5))
+        elements.append((0.5, 0.5))
+        self.assertEqual(profile.remove_element(1), elements.pop(1))
+        self.assertEqual(profile.replace_element(2, (-0.1, 0.3)), elements[2])
+        elements[2] = (-0.1, 0.3)
+
+        fresh = EuclideanProfile(len(elements), universe=profile.universe, perimeter=profile.perimeter)
+        fresh.elements = elements
+        self.assertSameMeasures(profile, fresh)
+
+    def test_generate_twice(self):
+        profile = EuclideanProfile(10)
+        profile.generate(equal_dist=False, seed=1)
+        profile.c1(), profile.c2(), profile.get_matrix()
+        profile.generate(equal_dist=False, seed=2)
+        fresh = EuclideanProfile(10, universe=profile.universe, perimeter=profile.perimeter)
+        fresh.generate(equal_dist=False, seed=2)
+        self.assertSameMeasures(profile, fresh)
+
+
+class SlidingWindowMonitorTest(unittest.TestCase):
+
+    def test_window_equals_fresh_profile(self):
+        window, length = 6, 5
+        # short vectors repeat often, so distinct elements are dropped by compact()
+        stream = numpy.random.RandomState(2).randint(0, 2, (80, length)).tolist()
+        monitor = SlidingWindowMonitor(window, length)
+        for arrivals, measures, consensus in monitor.run(stream):
+            elements = stream[max(0, arrivals - window):arrivals]
+            fresh = BinaryProfile(len(elements), length)
+            fresh.elements = elements
+            for f, value in measures.iteritems():
+                self.assertAlmostEqual(value, getattr(fresh, f)(), places=10, msg=f)
+            self.assertEqual(list(consensus), list(ConsensusO1.run(fresh)))
+            self.assertEqual(monitor.profile.elements, elements)
+
+
+class SampledStatisticsTest(TemporaryResultsTestCase):
+
+    def test_intervals_cover_exact_values(self):
+        for seed in range(3):
+            profile = EuclideanProfile(3000)
+            profile.generate(equal_dist=False, seed=seed)
+            # wide enough tolerance to stop sampling of c2 before the exact fallback
+            statistics = SampledStatistics(profile, tolerance=0.05, confidence=0.999, seed=seed)
+            for f, (low, high) in statistics.intervals.iteritems():
+                self.assertTrue(statistics.errors()[f] > 0, f)
+                self.assertTrue(low <= getattr(profile, f)() <= high, f)
+
+    def test_small_profile_is_exact(self):
+        profile = EuclideanProfile(12)
+        profile.generate(equal_dist=False, seed=1)
+        statistics = SampledStatistics(profile, seed=1)
+        for f in ['c2', 'c3', 'c4']:
+            self.assertAlmostEqual(statistics.measures[f], getattr(profile, f)(), places=10, msg=f)
+            self.assertEqual(statistics.errors()[f], 0)
+
+    def test_single_element(self):
+        profile = EuclideanProfile(1)
+        profile.generate(seed=1)
+        self.assertRaises(ValueError, SampledStatistics, profile)
+
+
+if __name__ == '__main__':
+    unittest.main()
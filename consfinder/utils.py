@@ -1,8 +1,15 @@
 # coding: utf-8
 
+import os
 import time
+import struct
 from functools import wraps
 
+import numpy
+
+
+MAX_SEED = 2 ** 31 - 1
+
 def exec_time(f):
     @wraps(f)
     def _inner(*args, **kwargs):
@@ -11,4 +18,15 @@ def exec_time(f):
         exec_t = time.time() - start_t
         print "Function %s : finished in %s" % (f.__name__, exec_t)
         return func_result
-    return _inner
\ No newline at end of file
+    return _inner
+
+
+def new_seed():
+    '''Random master seed taken from OS entropy'''
+    return struct.unpack('I', os.urandom(4))[0] % MAX_SEED
+
+
+def derive_seeds(master_seed, count):
+    '''Returns count independent seeds derived from master_seed, one per run.
+    The same master seed always gives the same seeds.'''
+    return numpy.random.RandomState(master_seed).randint(0, MAX_SEED, size=count).tolist()